@@ -1,13 +1,7 @@
 
 
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.integrate import solve_ivp
-from scipy.optimize import minimize
-from scipy.interpolate import interp1d
-from control.matlab import *
 from math import pi
-from scipy.interpolate import interp1d
 
 
 # Define the TCLabFT class to define the transfer function continiuous and discrete model of the plant
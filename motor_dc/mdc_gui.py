@@ -3,12 +3,11 @@ import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
 import time
 import datetime
-from mdc_model import DCMotorModel
+from mdc_model import DCMotorModel, DCMotorSimulator
 from mdc_parameters import DCMotorParameters
 from mdc_ft import DCMotorFT
 from mdc_stability import DCMotorStability
 from controllers import Controllers
-from scipy.integrate import solve_ivp
 from tools import *
 import tkinter as tk
 import threading
@@ -43,6 +42,7 @@ class DCMotorGUI:
         #========  CREATE THE OBJECTS ==============================================================
         #================================================================================================
         self.motor_model = DCMotorModel()
+        self.motor_simulator = DCMotorSimulator()
         self.motor_parameters = DCMotorParameters()
         self.motor_ft = DCMotorFT()
         self.motor_stability = DCMotorStability()
@@ -583,18 +583,13 @@ class DCMotorGUI:
             # Generate the PRBS signal
             V = SignalGenerator.create_prbs(*prbs_params)
             #V = self.motor_prbs.prbs(initial_value, amplitude, offset, register_length, frequency_divider, num_samples)
-            # Simulate the motor with the PRBS signal
-            y0 = np.array(x0)
-            ym = np.ones(len(t)) * x0[0] #velocity
-            for i in range(len(t)-1):
-                ts = [t[i], t[i+1]]
-                sol = solve_ivp(self.sim_motor, ts, y0, args=( V[i],))
-                y0 = sol.y[:,-1]
-                ym[i+1] = y0[0]
+            # Simulate the motor with the PRBS signal (held constant between samples)
+            ym, _ = self.motor_simulator.simulate(t, V, x0) #velocity
             # add a random noise to the angular velocity
             W = ym + np.random.normal(0, 0.5, len(t))
         else:
             V = self.setpoint           
+            from scipy.integrate import solve_ivp
             sol = solve_ivp(self.sim_motor, [t[0], t[-1]], x0, t_eval=t, args=(V,), method='RK45')
             # add a random noise to the angular velocity
             W = sol.y[0] + np.random.normal(0, 0.5, len(t))
@@ -666,10 +661,10 @@ class DCMotorGUI:
 
 
     def load_data(self):
-        # ask for the user to load the data in a txt file using np.loadtxt
+        # ask for the user to load the data in a txt file or in a binary bundle (header.json)
         filename = tk.filedialog.askopenfilename()
         if filename:
-            data = np.loadtxt(filename, delimiter=',', skiprows=1)     
+            data = DataSaver.load(filename)
             return data
         else:
             return None
@@ -1,10 +1,6 @@
 import sys
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.integrate import solve_ivp
-from scipy.optimize import minimize
-from mdc_parameters import DCMotorParameters
-import tkinter as tk
+from tools import DataSaver
 
 
 
@@ -26,18 +22,121 @@ class DCMotorModel:
         self.data = data
 
     def load_data(self):
-        # ask for the user to load the data in a txt file using np.loadtxt
-        filename = tk.filedialog.askopenfilename()
+        # ask for the user to load the data in a txt file or in a binary bundle (header.json)
+        from tkinter import filedialog
+        filename = filedialog.askopenfilename()
         if filename:
-            data = np.loadtxt(filename, delimiter=',', skiprows=1)     
+            data = DataSaver.load(filename)
             return data
         else:
             return None
 
+
+class DCMotorSimulator:
+    """
+    Simulation engine of the DC motor for piecewise constant (sampled) voltage inputs.
+
+    The linear part of the model (electrical and mechanical equations without friction
+    losses C*omega**2) is discretized exactly with the matrix exponential, and the
+    quadratic term is integrated with a second order exponential Runge-Kutta scheme
+    (ETD2RK) on fixed sub-steps. Several input sequences can be simulated at once.
+    """
+    def __init__(self, nl_params=None, substeps=4):
+        """
+        Constructor of the class
+        args:
+            nl_params: Non-linear model parameters for DC motor (J, B, Km, Ka, R, L, C)
+            substeps: Number of integration steps in every sampling interval
+        """
+        # Default non linear parameter values
+        default_parameters = {
+            'J': 0.00048115,
+            'B': 0.0026829,
+            'Km': 0.22076,
+            'Ka': 0.22076,
+            'R': 4.08,
+            'L': 0.011307,
+            'C': 1e-4
+        }
+        # Override default parameters if custom parameters are provided
+        if nl_params is not None:
+            default_parameters.update(nl_params)
+        self.nl_params = default_parameters
+        self.substeps = max(int(substeps), 1)
+
+        J, B, Km, Ka, R, L = [self.nl_params[name] for name in ('J', 'B', 'Km', 'Ka', 'R', 'L')]
+        self.A = np.array([[-B / J, Km / J],
+                           [-Ka / L, -R / L]])
+        self.Bu = np.array([0.0, 1.0 / L])
+        self.c_j = self.nl_params['C'] / J
+        self._matrices = {}  # Discretization for every step size used
+
+    def discretize(self, h):
+        """
+        Exponential integrator matrices for a step h
+        returns:
+            E: exp(A*h)
+            G: input vector of the zero order hold (h*phi1(A*h) @ Bu)
+            P1: h*phi1(A*h) first column (applied to the friction term)
+            P2: h*phi2(A*h) first column (ETD2RK correction)
+        """
+        key = float(f"{h:.12g}")  # Equal steps of a linspace differ in the last bits
+        if key not in self._matrices:
+            from scipy.linalg import expm
+            n = self.A.shape[0]
+            M = np.zeros((3 * n, 3 * n))
+            M[:n, :n] = self.A
+            M[:n, n:2 * n] = np.eye(n)
+            M[n:2 * n, 2 * n:] = np.eye(n)
+            Phi = expm(M * h)
+            E = Phi[:n, :n]
+            phi1 = Phi[:n, n:2 * n]       # h*phi1(A*h)
+            phi2 = Phi[:n, 2 * n:] / h    # h*phi2(A*h)
+            self._matrices[key] = (E, phi1 @ self.Bu, phi1[:, 0], phi2[:, 0])
+        return self._matrices[key]
+
+    def simulate(self, t, V, x0=(0, 0)):
+        """
+        Simulate the motor with the voltage V[i] held constant in [t[i], t[i+1]]
+        args:
+            t: time vector (n samples)
+            V: voltage, array of n samples or a batch with shape (m, n)
+            x0: initial state [angular velocity, current], one per batch row or shared
+        returns:
+            omega, i: angular velocity and current with the same shape as V
+        """
+        t = np.asarray(t, dtype=float)
+        V = np.asarray(V, dtype=float)
+        single = V.ndim == 1
+        V = np.atleast_2d(V)
+        m, n = V.shape
+
+        x = np.empty((m, 2))
+        x[:] = np.asarray(x0, dtype=float)
+        omega = np.empty((m, n))
+        current = np.empty((m, n))
+        omega[:, 0], current[:, 0] = x[:, 0], x[:, 1]
+
+        h = np.diff(t) / self.substeps
+        for k in range(n - 1):
+            E, G, P1, P2 = self.discretize(h[k])
+            u = V[:, k, None] * G
+            for _ in range(self.substeps):
+                N = -self.c_j * x[:, 0]**2
+                a = x @ E.T + u + N[:, None] * P1
+                x = a + (-self.c_j * a[:, 0]**2 - N)[:, None] * P2
+            omega[:, k + 1], current[:, k + 1] = x[:, 0], x[:, 1]
+
+        if single:
+            return omega[0], current[0]
+        return omega, current
+
+
 if __name__ == "__main__":
 
     # Get the non-linear parameters for the DC motor
     """
+    from mdc_parameters import DCMotorParameters
     specific_params = [
         {"name": "J", "label": "J", "default": 0.00040},
         {"name": "B", "label": "B", "default": 0.0022},
@@ -54,4 +153,34 @@ if __name__ == "__main__":
     # Initial values
     x0 = [0, 0]  # Initial conditions: [initial angular velocity, initial current]
 
-    
\ No newline at end of file
+    # Regression check of the simulation engine against solve_ivp in every sampling interval
+    import time
+    from scipy.integrate import solve_ivp
+    from tools import SignalGenerator
+
+    def sim_motor(t, x, V, J, B, Km, Ka, R, L, C):
+        omega, i = x
+        return [(1/J) * (Km * i - B * omega - C * omega**2), (1/L) * (V - R * i - Ka * omega)]
+
+    simulator = DCMotorSimulator()
+    p = simulator.nl_params
+    args = (p['J'], p['B'], p['Km'], p['Ka'], p['R'], p['L'], p['C'])
+    t = np.linspace(0, 5, 500)
+    V = SignalGenerator.create_prbs(0, 5, 10, 10, 3, len(t), 10)
+
+    t0 = time.perf_counter()
+    y0 = np.array(x0, dtype=float)
+    ym = np.zeros(len(t))
+    for k in range(len(t) - 1):
+        sol = solve_ivp(sim_motor, [t[k], t[k+1]], y0, args=(V[k],) + args, rtol=1e-9, atol=1e-9)
+        y0 = sol.y[:, -1]
+        ym[k+1] = y0[0]
+    t_ivp = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    omega, current = simulator.simulate(t, V, x0)
+    t_sim = time.perf_counter() - t0
+
+    error = np.max(np.abs(omega - ym))
+    print(f"solve_ivp: {t_ivp:.3f} s  DCMotorSimulator: {t_sim:.4f} s  max |omega error|: {error:.2e} rad/s")
+    assert error < 1e-3 * np.max(np.abs(ym))
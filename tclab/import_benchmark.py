@@ -0,0 +1,92 @@
+"""
+Import time benchmark of the tclab and motor_dc modules.
+
+Every module is imported in a fresh interpreter with `python -X importtime` and the
+cumulative time of the module is taken from the report (best of several runs). The
+light modules (Controllers, SignalGenerator) must stay under TARGET_MS on top of
+numpy, which all of them need: the heavy dependencies (scipy, control, matplotlib,
+tkinter) have to be imported inside the functions that use them.
+
+    python import_benchmark.py            # tclab and motor_dc modules
+    python import_benchmark.py tools tclab_ft --repeat 10
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+TARGET_MS = 100.0
+HERE = os.path.dirname(os.path.abspath(__file__))
+MOTOR_DC = os.path.join(os.path.dirname(HERE), 'motor_dc')
+
+# (module, folder, budget in ms or None)
+MODULES = [
+    ('controllers', HERE, TARGET_MS),
+    ('tools', HERE, TARGET_MS),
+    ('tclab_scheduler', HERE, TARGET_MS),
+    ('tclab_recorder', HERE, TARGET_MS),
+    ('tclab_session', HERE, TARGET_MS),
+    ('tclab_cli', HERE, TARGET_MS),
+    ('tclab_ft', HERE, None),
+    ('tclab_model', HERE, None),
+    ('tclab_simulator', HERE, None),
+    ('controllers', MOTOR_DC, TARGET_MS),
+    ('tools', MOTOR_DC, TARGET_MS),
+    ('mdc_model', MOTOR_DC, None),
+    ('mdc_ft', MOTOR_DC, None),
+]
+
+HEAVY = ('scipy', 'control', 'matplotlib', 'tkinter', 'numba')
+
+
+def import_time(module, folder):
+    """
+    Cumulative import time of a module in milliseconds and the heavy packages it loaded
+    """
+    code = f"import sys, {module}; print(','.join(m for m in {HEAVY!r} if m in sys.modules))"
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            cwd=folder, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    cumulative = None
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        if fields[2].rstrip() == f' {module}':  # Top level entry of the module
+            cumulative = int(fields[1]) / 1000.0
+    heavy = result.stdout.strip()
+    return cumulative, heavy.split(',') if heavy else []
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('modules', nargs='*', help='modules to measure (default: all)')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per module (the best is kept)')
+    args = parser.parse_args(argv)
+
+    modules = [m for m in MODULES if not args.modules or m[0] in args.modules]
+    failed = []
+    numpy_ms = min(import_time('numpy', HERE)[0] for _ in range(args.repeat))
+    print(f"numpy alone: {numpy_ms:.1f} ms")
+    print(f"{'module':>16s} {'folder':>9s} {'time [ms]':>10s} {'-numpy':>8s} {'budget':>8s}  heavy imports")
+    for module, folder, budget in modules:
+        try:
+            runs = [import_time(module, folder) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"{module:>16s} {os.path.basename(folder):>9s} {'error':>10s} {'':>8s} {'':>8s}  {e}")
+            continue
+        best = min(ms for ms, _ in runs)
+        own = max(best - numpy_ms, 0.0)
+        heavy = runs[0][1]
+        ok = budget is None or own <= budget
+        if not ok:
+            failed.append(module)
+        print(f"{module:>16s} {os.path.basename(folder):>9s} {best:10.1f} {own:8.1f} "
+              f"{'' if budget is None else f'{budget:.0f}':>8s}  {', '.join(heavy) or '-'}{'' if ok else '  OVER BUDGET'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
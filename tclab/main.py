@@ -1,7 +1,15 @@
-import tkinter as tk
-from tclab_gui import TCLabGUI
+import sys
+
 
 def main():
+    # Con argumentos se ejecuta la interfaz de línea de comandos (sin Tk)
+    if len(sys.argv) > 1:
+        from tclab_cli import main as cli
+        return cli(sys.argv[1:])
+
+    import tkinter as tk
+    from tclab_gui import TCLabGUI
+
     # Crea la ventana principal
     root = tk.Tk()
     # Crea una instancia de la GUI
@@ -10,4 +18,4 @@ def main():
     root.mainloop()
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
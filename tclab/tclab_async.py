@@ -0,0 +1,215 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncTCLab:
+    """
+    asyncio driver for a TCLab device (tclab_cae or SimulatedLab). The blocking serial
+    requests run in a single I/O thread (one request on the port at a time) while the
+    coroutines that issue them keep running, so writes and reads can be pipelined:
+        T1, T2 = await device.exchange(Q1=30, Q2=0)
+    """
+
+    def __init__(self, lab):
+        """
+        Constructor of the class
+        args:
+            lab: device with the T1/T2 properties and the Q1()/Q2() methods
+        """
+        self.lab = lab
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tclab-io')
+
+    async def _call(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def T1(self):
+        return await self._call(getattr, self.lab, 'T1')
+
+    async def T2(self):
+        return await self._call(getattr, self.lab, 'T2')
+
+    async def Q1(self, value):
+        return await self._call(self.lab.Q1, value)
+
+    async def Q2(self, value):
+        return await self._call(self.lab.Q2, value)
+
+    async def read(self):
+        """ Read both temperatures, the requests are queued back-to-back """
+        return tuple(await asyncio.gather(self.T1(), self.T2()))
+
+    async def write(self, Q1=None, Q2=None):
+        """ Write the heaters that are not None """
+        requests = []
+        if Q1 is not None:
+            requests.append(self.Q1(Q1))
+        if Q2 is not None:
+            requests.append(self.Q2(Q2))
+        await asyncio.gather(*requests)
+
+    async def exchange(self, Q1=None, Q2=None):
+        """ Write the heaters and read the temperatures in one pipelined batch """
+        results = await asyncio.gather(self.write(Q1, Q2), self.read())
+        return results[1]
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.lab.close()
+
+
+class PipelinedLab:
+    """
+    Drop-in replacement of the device object used by InterfazTCLab (self.lab). A
+    background asyncio loop keeps exchanging data with the device: Q1()/Q2() only
+    queue the new heater values and T1/T2 return the latest temperatures read, so the
+    control loop never waits for a serial round trip. `age` gives the seconds since
+    the temperatures were read. A failed exchange is retried with exponential back off
+    (the heater values are kept for the next attempt); while the device fails, or after
+    max_retries consecutive failures stop the loop, T1/T2 raise the last error.
+    """
+
+    def __init__(self, lab, poll_interval=0.01, timeout=10.0, max_retries=5, backoff=0.1):
+        """
+        Constructor of the class
+        args:
+            lab: device with the T1/T2 properties and the Q1()/Q2() methods
+            poll_interval: maximum seconds between exchanges when no heater value is
+                           pending (0 to exchange continuously)
+            timeout: seconds T1/T2 wait for the first read before a TimeoutError
+            max_retries: consecutive failed exchanges before the background loop stops
+            backoff: seconds before the first retry, doubled after every failure
+        """
+        self.device = AsyncTCLab(lab)
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.failures = 0      # Consecutive failed exchanges
+        self._error = None     # Exception of the last exchange, None if it succeeded
+        self.heaters = {'Q1': 0.0, 'Q2': 0.0}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._temperatures = (None, None)
+        self._read_time = None
+        self._ready = threading.Event()
+        self._closed = False
+
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+        self._wakeup = None
+        self._task = asyncio.run_coroutine_threadsafe(self._run(), self.loop)
+
+    async def _run(self):
+        self._wakeup = asyncio.Event()
+        while True:
+            with self._lock:
+                writes, self._pending = self._pending, {}
+                closed = self._closed
+            if closed and not writes:
+                break
+            try:
+                temperatures = await self.device.exchange(**writes)
+            except Exception as e:
+                self._error = e
+                self.failures += 1
+                with self._lock:
+                    self._pending = dict(writes, **self._pending)  # Retry the writes not replaced
+                self._ready.set()  # Wake the readers, they raise the error
+                if self.failures > self.max_retries or self._closed:
+                    break
+                await asyncio.sleep(self.backoff * 2**(self.failures - 1))
+                continue
+            self._temperatures = temperatures
+            self._read_time = time.monotonic()
+            self._error = None
+            self.failures = 0
+            self._ready.set()
+            if self.poll_interval > 0 and not self._pending and not self._closed:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _set(self, name, value):
+        with self._lock:
+            self._pending[name] = value
+            self.heaters[name] = value
+        self.loop.call_soon_threadsafe(self._wake)
+
+    def _read(self, i):
+        if not self._ready.wait(self.timeout):
+            raise TimeoutError(f"No temperature read from the device in {self.timeout} s.")
+        error = self._error
+        if error is not None:
+            raise error
+        return self._temperatures[i]
+
+    @property
+    def T1(self):
+        return self._read(0)
+
+    @property
+    def T2(self):
+        return self._read(1)
+
+    @property
+    def age(self):
+        """ Seconds since the last read of the temperatures """
+        if self._read_time is None:
+            return None
+        return time.monotonic() - self._read_time
+
+    def Q1(self, value=None):
+        if value is not None:
+            self._set('Q1', value)
+        return self.heaters['Q1']
+
+    def Q2(self, value=None):
+        if value is not None:
+            self._set('Q2', value)
+        return self.heaters['Q2']
+
+    def close(self):
+        """ Send the pending heater values, stop the background loop and close the device """
+        with self._lock:
+            self._closed = True
+        self.loop.call_soon_threadsafe(self._wake)
+        self._task.result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+        self.device.close()
+
+
+if __name__ == "__main__":
+    from tclab_simulator import SimulatedLab
+
+    # Loop of 50 iterations with 10 ms per serial request and 10 ms of computation
+    def control_loop(lab, n=50):
+        t0 = time.perf_counter()
+        for k in range(n):
+            T1, T2 = lab.T1, lab.T2
+            time.sleep(0.01)  # Controller and bookkeeping
+            lab.Q1(50.0)
+            lab.Q2(20.0)
+        return (time.perf_counter() - t0) / n, (T1, T2)
+
+    blocking = SimulatedLab(latency=0.01)
+    t_blocking, T_blocking = control_loop(blocking)
+    blocking.close()
+
+    pipelined = PipelinedLab(SimulatedLab(latency=0.01))
+    t_pipelined, T_pipelined = control_loop(pipelined)
+    pipelined.close()
+    print(f"Iteration time: blocking {1000 * t_blocking:.1f} ms, pipelined {1000 * t_pipelined:.1f} ms")
+    print(f"Last reading: blocking T1 {T_blocking[0]:.2f} T2 {T_blocking[1]:.2f}, "
+          f"pipelined T1 {T_pipelined[0]:.2f} T2 {T_pipelined[1]:.2f} degC")
@@ -0,0 +1,172 @@
+import threading
+from collections import deque
+
+
+class GUIUpdateBridge:
+    """
+    Producer/consumer bridge between the thread that runs the experiment and the Tk
+    main loop. The worker thread leaves graph and terminal updates in two buffers and
+    a single periodic Tk callback drains them: graph updates are coalesced when they
+    are put, so only the latest update of each series is drawn (stale redraws are
+    dropped), and the terminal lines are kept in order and inserted in one batch.
+    The line buffer is bounded: if the Tk loop stalls and more than max_lines lines
+    are pending, the oldest ones are replaced by one "N lines omitted" marker.
+    Other widget updates of the worker (e.g. unchecking a checkbox) are queued with
+    put_call and run in the same poll, after the terminal text.
+    """
+
+    def __init__(self, master, graph_callback, terminal_callback, period=50, max_lines=10000):
+        """
+        Constructor of the class
+        args:
+            master: Tk widget used to schedule the poller
+            graph_callback: function(*args) that draws a graph update
+            terminal_callback: function(text) that inserts text in the terminal
+            period: polling period in milliseconds
+            max_lines: maximum number of pending terminal lines
+        """
+        self.master = master
+        self.graph_callback = graph_callback
+        self.terminal_callback = terminal_callback
+        self.period = period
+        self.running = False
+        self._lock = threading.Lock()  # Protects the buffers and the metrics
+        self._graphs = {}  # key -> newest arguments, in the order of the last update
+        self._lines = deque(maxlen=max_lines)
+        self._omitted = 0  # Lines dropped from the buffer since the last poll
+        self._calls = []  # (function, args) to run in the Tk main loop, in order
+        self.metrics = {
+            'depth': 0,          # Pending updates in the last poll
+            'max_depth': 0,      # Maximum pending updates seen by the poller
+            'coalesced': 0,      # Stale graph updates replaced by a newer one
+            'frames': 0,         # Graph updates drawn
+            'lines': 0,          # Terminal lines inserted
+            'lines_dropped': 0,  # Terminal lines dropped because the buffer was full
+            'polls': 0
+        }
+
+    def start(self):
+        """ Start the periodic poller in the Tk main loop """
+        if not self.running:
+            self.running = True
+            self.master.after(self.period, self._poll)
+
+    def stop(self):
+        """ Stop the poller after the next poll """
+        self.running = False
+
+    def put_graph(self, key, *args):
+        """
+        Leave a graph update (called from the worker thread)
+        args:
+            key: identifies the series, only the latest update of each key is drawn
+            args: arguments of graph_callback
+        """
+        with self._lock:
+            if key in self._graphs:
+                self.metrics['coalesced'] += 1
+                del self._graphs[key]  # Keep the order of the newest update
+            self._graphs[key] = args
+
+    def put_terminal(self, text):
+        """ Leave text for the terminal (called from the worker thread) """
+        with self._lock:
+            if len(self._lines) == self._lines.maxlen:
+                self._omitted += 1  # The deque drops the oldest line
+                self.metrics['lines_dropped'] += 1
+            self._lines.append(text)
+
+    def put_line(self, text):
+        """ Leave one line for the terminal, the newline is added (called from the worker thread) """
+        self.put_terminal(text + '\n')
+
+    def put_call(self, func, *args):
+        """
+        Leave a call that must run in the Tk main loop (called from the worker thread)
+        args:
+            func: function that updates the widgets
+            args: arguments of func
+        """
+        with self._lock:
+            self._calls.append((func, args))
+
+    def pending(self):
+        """ Number of updates waiting for the next poll """
+        with self._lock:
+            return len(self._graphs) + len(self._lines) + len(self._calls)
+
+    def stats(self):
+        """ Copy of the metrics (thread safe) """
+        with self._lock:
+            return dict(self.metrics)
+
+    def drain(self):
+        """
+        Process all the pending updates (called in the Tk main loop)
+        """
+        with self._lock:
+            graphs, self._graphs = self._graphs, {}
+            lines, self._lines = list(self._lines), deque(maxlen=self._lines.maxlen)
+            omitted, self._omitted = self._omitted, 0
+            calls, self._calls = self._calls, []
+            depth = len(graphs) + len(lines) + len(calls)
+            self.metrics['depth'] = depth
+            self.metrics['max_depth'] = max(self.metrics['max_depth'], depth)
+            self.metrics['polls'] += 1
+
+        for args in graphs.values():
+            self.graph_callback(*args)
+        inserted = len(lines)
+        if omitted:
+            lines.insert(0, f"... {omitted} lines omitted ...\n")
+        if lines:
+            self.terminal_callback(''.join(lines))
+        for func, args in calls:
+            func(*args)
+        with self._lock:
+            self.metrics['frames'] += len(graphs)
+            self.metrics['lines'] += inserted
+
+    def _poll(self):
+        self.drain()
+        if self.running:
+            self.master.after(self.period, self._poll)
+
+
+if __name__ == "__main__":
+    frames, text = [], []
+    bridge = GUIUpdateBridge(None, lambda k: frames.append(k), text.append)
+
+    def worker():
+        for k in range(10000):
+            bridge.put_graph('temperature', k)
+            bridge.put_terminal(f"Time: {k:6.1f}\n")
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    # Drain the buffers as fast as possible instead of polling from Tk
+    while thread.is_alive() or bridge.pending():
+        bridge.drain()
+    thread.join()
+    bridge.drain()
+    lines = ''.join(text).splitlines()
+    assert len(lines) == 10000 and lines[-1] == f"Time: {9999:6.1f}"
+    print(f"Last frame drawn: {frames[-1]}, {len(lines)} terminal lines, metrics: {bridge.stats()}")
+
+    # Stalled poller: the line buffer stays bounded and the oldest lines become a marker
+    text = []
+    bridge = GUIUpdateBridge(None, lambda k: None, text.append, max_lines=100)
+    for k in range(1000):
+        bridge.put_terminal(f"Time: {k:6.1f}\n")
+    bridge.drain()
+    lines = ''.join(text).splitlines()
+    assert lines[0] == "... 900 lines omitted ..." and len(lines) == 101 and lines[-1] == f"Time: {999:6.1f}"
+    print(f"Stalled poller: {bridge.stats()['lines_dropped']} lines dropped, first line '{lines[0]}'")
+
+    # Calls queued by a worker run in the drain, after the text that precedes them
+    events = []
+    bridge = GUIUpdateBridge(None, lambda k: None, lambda s: events.append(s))
+    bridge.put_line("Estimation failed: ValueError()")
+    bridge.put_call(events.append, 'uncheck')
+    bridge.drain()
+    assert events == ["Estimation failed: ValueError()\n", 'uncheck'] and bridge.pending() == 0
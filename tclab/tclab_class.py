@@ -1,21 +1,33 @@
 import sys
 import time
 import datetime
-import tclab_cae.tclab_cae as tclab
 import numpy as np
-import matplotlib.pyplot as plt
-from tclab_plotter import TCLabPlotter
 from controllers import Controllers
+from tclab_scheduler import LoopScheduler
+from tclab_profiler import NullProfiler
+from tclab_async import PipelinedLab
 from tools import *
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
 
 # Define the TCLAB_CAE class to comunicate with the real device
 class InterfazTCLab:
     # Constructor of the class
-    def __init__(self):
-        """Connect to the TCLab device"""
-        pass
+    def __init__(self, lab=None, pipelined=False):
+        """
+        Connect to the TCLab device
+        args:
+            lab: device object with the tclab_cae interface (T1, Q1) to use instead of
+                 connecting to the real device, e.g. SimulatedLab
+            pipelined: wrap the device in PipelinedLab so the reads and writes run in a
+                       background I/O loop and do not block the control loop
+        """
+        if lab is not None:
+            self.lab = lab
+        else:
+            import tclab_cae.tclab_cae as tclab  # Only needed for the real device
+            pass
+
+        if pipelined:
+            self.lab = PipelinedLab(self.lab)
 
 
     # Method to disconnect from the device
@@ -34,7 +46,7 @@ class InterfazTCLab:
 
 
 
-    def open_loop_response(self, test_type='step', filename='data.txt', duration=None, step_test=None, prbs_params=None, update_data_callback=None, stop=False):
+    def open_loop_response(self, test_type='step', filename='data.txt', duration=None, step_test=None, prbs_params=None, update_data_callback=None, stop=False, recorder=None, scheduler=None, ask_save=True):
         """
         Open loop response of the Temperature Control Lab
         args:
@@ -45,6 +57,10 @@ class InterfazTCLab:
             prbs_params: parameters of the PRBS test
             update_data_callback: callback function to update the data in a GUI
             stop: flag to stop the test
+            recorder: DataRecorder that stores every sample on disk during the test
+            scheduler: LoopScheduler that paces the samples (1 s period if None)
+            ask_save: with update_data_callback, ask with a Tk dialog where to save the
+                      data; if False the data is saved in filename without dialogs
         """
         tm, T1, Q1 = [], [], []
         
@@ -67,8 +83,15 @@ class InterfazTCLab:
 
         # Create a plotter object if no callback is provided
         if update_data_callback == None:
+            import matplotlib.pyplot as plt
+            from tclab_plotter import TCLabPlotter
             pass
         
+        # Scheduler of the samples
+        if scheduler is None:
+            scheduler = LoopScheduler(period=1.0)
+        scheduler.start()
+
         # Loop to control the TCLab
         try:
             for k in range(1, duration + 1):
@@ -90,9 +113,16 @@ class InterfazTCLab:
                     # Plot the data
                     pass
 
-                # Calculate sleep time and record time and temperature 
+                # Record time and temperature 
                 pass
 
+                # Stream the sample to disk, once it has been recorded
+                if recorder is not None and tm:
+                    recorder.append(tm[-1], Q1[k], T1[-1])
+
+                # Wait for the next sample
+                scheduler.wait()
+
                 # Check if the user requested to stop the test
                 if self.stop_requested:
                     break
@@ -101,22 +131,16 @@ class InterfazTCLab:
             # Save the data to a text file
             self.lab.Q1(0)  # turn off the heater
             print("Test completed.")
+            Q1 = Q1[:len(tm)]  # Only the recorded samples, the test may stop early
             if update_data_callback == None:
                 # Save the data to a text file
                 self.save_txt(tm, Q1, T1, filename)
                 input("Press Enter to Finish")
-            else:
+            elif ask_save:
                 #preguntar si desea guardar los datos con mensaje emergente tkinter
-                root = tk.Tk()
-                root.withdraw()
-                if messagebox.askyesno("Save data", "Do you want to save the data?"):
-                    file = filedialog.asksaveasfile(mode='w',
-                                                     defaultextension=".txt", 
-                                                     initialfile=filename)
-                    if file is not None:
-                        self.save_txt(tm, Q1, T1, file.name)
-                        file.close()
-                root.destroy()
+                self.save_dialog(tm, Q1, T1, filename)
+            else:
+                self.save_txt(tm, Q1, T1, filename)
 
 
         except KeyboardInterrupt:
@@ -125,12 +149,35 @@ class InterfazTCLab:
             print(f"Unexpected error: {e}")
         finally:
             self.lab.Q1(0)  # Asegura que el heater se apague al finalizar.
+            if recorder is not None:
+                recorder.flush()
             if update_data_callback == None:
                 self.disconnect()
 
-    def closed_loop(self, setpoint, duration, controller, filename='closed_loop_data.txt',update_data_callback=None):
-        nit = int(duration)  # Total number of iterations
-        ts_samples = int(controller.Ts)  # Sampling period in seconds (assuming Ts is an integer)
+    def closed_loop(self, setpoint, duration, controller, filename='closed_loop_data.txt',update_data_callback=None, recorder=None, scheduler=None, profiler=None, ask_save=True):
+        """
+        Closed loop control of the Temperature Control Lab
+        args:
+            setpoint: temperature setpoint
+            duration: time in seconds of the test
+            controller: Controllers instance
+            filename: name of the file to save the data
+            update_data_callback: callback function to update the data in a GUI
+            recorder: DataRecorder that stores every sample on disk during the test
+            scheduler: LoopScheduler that paces the loop (1 s period if None), its period
+                       may be a fraction of a second
+            profiler: LoopProfiler that times the read, control, record, plot and wait
+                      phases of every iteration (disabled if None)
+            ask_save: with update_data_callback, ask with a Tk dialog where to save the
+                      data; if False the data is saved in filename without dialogs
+        """
+        if scheduler is None:
+            scheduler = LoopScheduler(period=1.0)
+        if profiler is None:
+            profiler = NullProfiler()
+        nit = int(duration / scheduler.period)  # Total number of iterations
+        ts_samples = max(1, int(round(controller.Ts / scheduler.period)))  # Loop iterations per controller sample
+        plot_samples = max(1, int(round(1.0 / scheduler.period)))  # Loop iterations per graph update
 
         # Initialize arrays to store time, control actions, system outputs, errors, and setpoints
         t = np.zeros(nit)
@@ -142,30 +189,38 @@ class InterfazTCLab:
         # Initialize arrays to store measured time and temperature
         tm = np.zeros(nit)
 
-        start_time = time.time()  # Record the start time
-
         # Set up plotting if no update data callback is provided
         if update_data_callback is None:
+            import matplotlib.pyplot as plt
+            from tclab_plotter import TCLabPlotter
             plt.ion()  # Enable interactive mode for live plotting
             plotter = TCLabPlotter()  # Create an instance of the plotter
             fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 7), sharex=True)  # Create subplots for controlled and manipulated variables
 
+        scheduler.start()  # Record the start time
         try:
             for k in range(1, nit):
-                current_time = time.time()  # Get the current time
-                tm[k] = current_time - start_time  # Calculate elapsed time
+                profiler.begin()
+                tm[k] = scheduler.elapsed()  # Calculate elapsed time
                 r[k] = setpoint  # You can update the setpoint in real-time here if desired
                 y[k] = self.lab.T1  # Read the current temperature
                 e[k] = r[k] - y[k]  # Calculate the control error
+                profiler.mark('read')
 
                 # Calculate the control action every Ts
                 if k % ts_samples == 0:
                     pass
                 else:
                     pass
+                profiler.mark('control')
+
+                # Stream the sample to disk
+                if recorder is not None:
+                    recorder.append(tm[k], u[k], y[k])
+                profiler.mark('record')
                 
                 # Update the graph every second
-                if k % 1 == 0:
+                if k % plot_samples == 0:
                     if update_data_callback:
                         update_data_callback(tm, y, u, r, k)  # Update data if callback is provided
                     else:
@@ -177,11 +232,12 @@ class InterfazTCLab:
                         # Plot the controlled and manipulated variables
                         plotter.plot_control(tm[:k + 1], y[:k + 1], u[:k + 1], r[:k + 1], ax1=ax1, ax2=ax2)
                         plt.pause(0.01)  # Pause to allow the plot to update
+                profiler.mark('plot')
 
-                # Calculate the sleep time to maintain a consistent loop period
-                sleep_time = start_time + k - time.time()
-                if sleep_time > 0:
-                    time.sleep(sleep_time)
+                # Wait for the next period (drift-free, overruns handled by the scheduler policy)
+                scheduler.wait()
+                profiler.mark('wait')
+                profiler.end()
 
                 # Break the loop if stop is requested
                 if self.stop_requested:
@@ -194,15 +250,10 @@ class InterfazTCLab:
             if update_data_callback is None:
                 self.save_txt(tm, u, y, 'closed_loop_data.txt')
                 input("Press Enter to Finish")
+            elif ask_save:
+                self.save_dialog(tm, u, y, filename)
             else:
-                root = tk.Tk()  # Create a Tkinter root widget
-                root.withdraw()  # Hide the root window
-                if messagebox.askyesno("Save data", "Do you want to save the data?"):
-                    file = filedialog.asksaveasfile(mode='w', defaultextension=".txt", initialfile=filename)
-                    if file is not None:
-                        self.save_txt(tm, u, y, file.name)
-                        file.close()
-                root.destroy()
+                self.save_txt(tm, u, y, filename)
 
         except KeyboardInterrupt:
             print("Closed-loop control interrupted by user.")
@@ -210,10 +261,29 @@ class InterfazTCLab:
             print(f"Unexpected error: {e}")
         finally:
             self.lab.Q1(0)  # Ensure the heater is turned off in case of interruption
+            if recorder is not None:
+                recorder.flush()
+            profiler.finish()  # Write the profile report if requested
             if update_data_callback is None:
                 self.disconnect()  # Disconnect from the device if no update data callback is provided
 
 
+    def save_dialog(self, t, u1, y1, filename):
+        """
+        Ask with Tk dialogs if and where the data is saved (tkinter is only imported here)
+        """
+        import tkinter as tk
+        from tkinter import filedialog, messagebox
+
+        root = tk.Tk()  # Create a Tkinter root widget
+        root.withdraw()  # Hide the root window
+        if messagebox.askyesno("Save data", "Do you want to save the data?"):
+            file = filedialog.asksaveasfile(mode='w', defaultextension=".txt", initialfile=filename)
+            if file is not None:
+                self.save_txt(t, u1, y1, file.name)
+                file.close()
+        root.destroy()
+
     @staticmethod
     def save_txt(t, u1, y1, filename='tclab_step.txt'):
         """
@@ -0,0 +1,279 @@
+"""
+Headless command line interface of the TCLab experiments.
+
+    python tclab_cli.py step --duration 600 --step 50 --output step.txt
+    python tclab_cli.py prbs --amplitude 20 --offset 50 --output prbs.txt --simulate
+    python tclab_cli.py closed-loop --setpoint 45 --kp 5 --ti 120 --duration 900
+    python tclab_cli.py identify --data prbs.txt
+    python tclab_cli.py tune --data prbs.txt --rule ziegler_nichols --type PID
+    python tclab_cli.py sweep --K 0.6 --tau 160 --theta 12 --ts-grid 1 2 5 --criterion itae
+
+Every command writes a JSON summary to stdout (and to --summary if given). Neither
+tkinter nor matplotlib are imported unless --plot is requested, so the commands run
+on servers without display. With --simulate the experiment runs on TCLabSimulator in
+virtual time.
+"""
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from tclab_scheduler import LoopScheduler
+from tools import DataSaver, SamplingTime
+
+RULES = ('ziegler_nichols', 'cohen_coon', 'iae', 'iaet')
+CRITERIA = ('iae', 'ise', 'itae', 'overshoot', 'settling_time', 'rise_time', 'effort')
+
+
+def make_lab(args):
+    """
+    Device and scheduler of an experiment
+    returns:
+        lab, scheduler
+    """
+    if args.simulate:
+        from tclab_simulator import TCLabSimulator
+        lab = TCLabSimulator(noise=args.noise, seed=args.seed)
+        return lab, lab.scheduler(period=args.period)
+    from tclab_class import InterfazTCLab
+    return InterfazTCLab().lab, LoopScheduler(period=args.period)
+
+
+def run_experiment(args, **experiment):
+    """
+    Run one experiment with SessionManager (no dialogs) and save the data in args.output
+    returns:
+        data [n, 3] (time, heater, temperature), summary dictionary
+    """
+    from tclab_session import SessionManager
+
+    lab, scheduler = make_lab(args)
+    session = SessionManager(scheduler=scheduler, lockstep=args.simulate)
+    session.add_rig('tclab', lab, **experiment)
+    t0 = time.perf_counter()
+    try:
+        data = session.run()['tclab']
+    finally:
+        lab.close()
+    elapsed = time.perf_counter() - t0
+
+    if args.format == 'bundle':
+        DataSaver.save_bundle(args.output, data.T, Ts=args.period, metadata={'experiment': experiment['experiment']})
+    else:
+        DataSaver.save_txt(data[:, 0], data[:, 1], data[:, 2], args.output)
+
+    health = session.health()
+    summary = {
+        'command': args.command,
+        'output': args.output,
+        'simulated': bool(args.simulate),
+        'samples': len(data),
+        'duration': float(data[-1, 0]) if len(data) else 0.0,
+        'wall_time': elapsed,
+        'T_initial': float(data[0, 2]) if len(data) else None,
+        'T_final': float(data[-1, 2]) if len(data) else None,
+        'T_max': float(data[:, 2].max()) if len(data) else None,
+        'Q_mean': float(data[:, 1].mean()) if len(data) else None,
+        'health': health['tclab'],
+        'scheduler': health['scheduler']
+    }
+    return data, summary
+
+
+def cmd_step(args):
+    return run_experiment(args, experiment='step', duration=args.duration, step_test=args.step)
+
+
+def cmd_prbs(args):
+    prbs_params = (args.initial, args.amplitude, args.offset, args.register, args.divider, args.samples, args.start)
+    return run_experiment(args, experiment='prbs', prbs_params=prbs_params)
+
+
+def cmd_closed_loop(args):
+    from controllers import Controllers
+
+    controller = Controllers(args.kp, args.ti, args.td, args.ts, u_min=0, u_max=100)  # Heater range
+    data, summary = run_experiment(args, experiment='closed_loop', duration=args.duration,
+                                   setpoint=args.setpoint, controller=controller)
+    e = args.setpoint - data[:, 2]
+    summary.update({'setpoint': args.setpoint, 'iae': float(np.sum(np.abs(e)) * args.period),
+                    'final_error': float(e[-1]) if len(e) else None})
+    return data, summary
+
+
+def identify(filename, n_starts):
+    from tclab_ft import TCLabFT
+
+    data = DataSaver.load(filename)
+    fit = TCLabFT(data=data, x0=data[0, 2]).identify(n_starts=n_starts)
+    return data, fit
+
+
+def cmd_identify(args):
+    data, fit = identify(args.data, args.starts)
+    summary = {'command': args.command, 'data': args.data}
+    summary.update({key: value for key, value in fit.items() if key != 'covariance'})
+    summary['params'] = dict(zip(('K', 'tau', 'theta'), fit['params']))
+    summary['std_errors'] = dict(zip(('K', 'tau', 'theta'), fit['std_errors']))
+    ts = SamplingTime.fopdt(*fit['params'])
+    summary['sampling_time'] = {key: float(value[0]) for key, value in ts.items()}
+    summary['message'] = str(fit['message'])
+    return data, summary
+
+
+def model_params(args):
+    """
+    FOPDT model of the tuning commands, identified from --data or given with --K, --tau, --theta
+    returns:
+        data (None if not identified), (K, tau, theta)
+    """
+    if args.data is not None:
+        data, fit = identify(args.data, args.starts)
+        return data, fit['params']
+    if None in (args.K, args.tau, args.theta):
+        raise SystemExit(f"{args.command} needs --data or the model parameters --K, --tau and --theta")
+    return None, (args.K, args.tau, args.theta)
+
+
+def finite(value):
+    """ inf and nan as None, JSON has no infinity """
+    return value if np.isfinite(value) else None
+
+
+def cmd_tune(args):
+    from controllers import Controllers
+
+    data, (K, tau, theta) = model_params(args)
+    rule = getattr(Controllers, f'tune_{args.rule}')
+    Kp, Ti, Td = rule(K, theta, tau, args.ts, control_type=args.type)
+    summary = {
+        'command': args.command,
+        'model': {'K': K, 'tau': tau, 'theta': theta},
+        'rule': args.rule,
+        'type': args.type,
+        'Ts': args.ts,
+        'Kp': Kp,
+        'Ti': finite(Ti),
+        'Td': Td
+    }
+    return data, summary
+
+
+def cmd_sweep(args):
+    from tclab_tuning import tuning_sweep
+
+    data, lin_params = model_params(args)
+    table = tuning_sweep(lin_params, Ts_grid=args.ts_grid, step=args.step, criterion=args.criterion,
+                         max_workers=args.workers)
+    summary = {
+        'command': args.command,
+        'model': dict(zip(('K', 'tau', 'theta'), lin_params)),
+        'criterion': args.criterion,
+        'table': [{key: finite(value) if isinstance(value, float) else value for key, value in row.items()}
+                  for row in table]
+    }
+    return data, summary
+
+
+def plot(data, title):
+    """ Plot the data of the command (only here matplotlib is imported) """
+    import matplotlib.pyplot as plt
+
+    fig, (ax1, ax2) = plt.subplots(2, 1, sharex=True)
+    ax1.plot(data[:, 0], data[:, 2])
+    ax1.set_ylabel('Temperature 1 (degC)')
+    ax1.set_title(title)
+    ax2.step(data[:, 0], data[:, 1], where='post')
+    ax2.set_ylabel('Heater 1 (%)')
+    ax2.set_xlabel('Time (sec)')
+    plt.show()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='tclab', description='Headless TCLab experiments')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def experiment_parser(name, help, output):
+        sub = commands.add_parser(name, help=help)
+        sub.add_argument('--output', default=output, help='data file (or directory with --format bundle)')
+        sub.add_argument('--format', choices=('txt', 'bundle'), default='txt')
+        sub.add_argument('--period', type=float, default=1.0, help='sampling period [s]')
+        sub.add_argument('--simulate', action='store_true', help='run on TCLabSimulator in virtual time')
+        sub.add_argument('--noise', type=float, default=0.1, help='measurement noise of the simulator [degC]')
+        sub.add_argument('--seed', type=int, default=0, help='seed of the simulator noise')
+        return sub
+
+    sub = experiment_parser('step', 'open loop step test', 'data.txt')
+    sub.add_argument('--duration', type=int, default=600, help='duration [s]')
+    sub.add_argument('--step', type=float, default=50.0, help='heater step [%%]')
+    sub.set_defaults(func=cmd_step)
+
+    sub = experiment_parser('prbs', 'open loop PRBS test', 'data.txt')
+    sub.add_argument('--initial', type=float, default=0.0, help='heater before the PRBS [%%]')
+    sub.add_argument('--amplitude', type=float, default=20.0)
+    sub.add_argument('--offset', type=float, default=50.0)
+    sub.add_argument('--register', type=int, default=10, help='register length')
+    sub.add_argument('--divider', type=int, default=50, help='samples per bit')
+    sub.add_argument('--samples', type=int, default=3600)
+    sub.add_argument('--start', type=int, default=30, help='samples before the PRBS')
+    sub.set_defaults(func=cmd_prbs)
+
+    sub = experiment_parser('closed-loop', 'closed loop PID test', 'closed_loop_data.txt')
+    sub.add_argument('--setpoint', type=float, required=True, help='temperature setpoint [degC]')
+    sub.add_argument('--duration', type=int, default=900, help='duration [s]')
+    sub.add_argument('--kp', type=float, required=True)
+    sub.add_argument('--ti', type=float, default=None)
+    sub.add_argument('--td', type=float, default=None)
+    sub.add_argument('--ts', type=float, default=1.0, help='controller sampling time [s]')
+    sub.set_defaults(func=cmd_closed_loop)
+
+    sub = commands.add_parser('identify', help='identify the FOPDT model from a data file')
+    sub.add_argument('--data', required=True, help='text file or bundle directory')
+    sub.add_argument('--starts', type=int, default=3, help='initial guesses refined')
+    sub.set_defaults(func=cmd_identify)
+
+    sub = commands.add_parser('tune', help='tune a controller from the FOPDT model')
+    sub.add_argument('--data', default=None, help='identify the model from this file')
+    sub.add_argument('--starts', type=int, default=3, help='initial guesses refined')
+    sub.add_argument('--K', type=float, default=None)
+    sub.add_argument('--tau', type=float, default=None)
+    sub.add_argument('--theta', type=float, default=None)
+    sub.add_argument('--rule', choices=RULES, default='ziegler_nichols')
+    sub.add_argument('--type', choices=('P', 'PI', 'PID'), default='PI')
+    sub.add_argument('--ts', type=float, default=1.0, help='controller sampling time [s]')
+    sub.set_defaults(func=cmd_tune)
+
+    sub = commands.add_parser('sweep', help='rank every tuning rule x P/PI/PID x Ts in simulation')
+    sub.add_argument('--data', default=None, help='identify the model from this file')
+    sub.add_argument('--starts', type=int, default=3, help='initial guesses refined')
+    sub.add_argument('--K', type=float, default=None)
+    sub.add_argument('--tau', type=float, default=None)
+    sub.add_argument('--theta', type=float, default=None)
+    sub.add_argument('--ts-grid', type=float, nargs='+', default=[1.0, 2.0, 5.0, 10.0],
+                     help='controller sampling times [s]')
+    sub.add_argument('--step', type=float, default=20.0, help='setpoint step [degC]')
+    sub.add_argument('--criterion', choices=CRITERIA, default='iae')
+    sub.add_argument('--workers', type=int, default=None, help='processes (all the cores if not given)')
+    sub.set_defaults(func=cmd_sweep)
+
+    for sub in commands.choices.values():
+        sub.add_argument('--summary', default=None, help='also write the JSON summary in this file')
+        sub.add_argument('--plot', action='store_true', help='plot the data at the end (imports matplotlib)')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    data, summary = args.func(args)
+    text = json.dumps(summary, indent=2, default=float)
+    print(text)
+    if args.summary is not None:
+        with open(args.summary, 'w') as f:
+            f.write(text + '\n')
+    if args.plot and data is not None:
+        plot(data, args.command)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+import numpy as np
+from controllers import BatchControllers
+from tclab_ft import TCLabFT
+from tclab_model import TCLabModel, energy_balance_rk4
+
+
+class ClosedLoopSimulator:
+    """
+    Offline closed loop simulation of a Controllers instance (or a BatchControllers
+    with N loops) against the discrete FOPDT model of TCLabFT or the non linear
+    energy balance of TCLabModel. The loop follows InterfazTCLab.closed_loop: the
+    temperature is read every period, the control action is computed every
+    controller.Ts and held in between, and the same t, u, y, e, r arrays are
+    returned (shape (N, n) for a BatchControllers).
+    """
+
+    def __init__(self, period=1.0):
+        """
+        Constructor of the class
+        args:
+            period: loop period in seconds (the sampling of the plant)
+        """
+        self.period = period
+
+    def _loop(self, controller, setpoint, duration, y0, plant):
+        # Common loop, plant(k, u) returns the output at k + 1 with the action u[k] held
+        batch = isinstance(controller, BatchControllers)
+        N = len(controller) if batch else 1
+        nit = int(duration / self.period)
+        t = np.arange(nit) * self.period
+        r = np.zeros(nit)
+        r[1:] = np.broadcast_to(setpoint, nit)[1:]  # Setpoint profile or constant
+        u = np.zeros((N, nit))
+        y = np.zeros((N, nit))
+        y[:, 0] = y0
+        ts_samples = np.maximum(1, np.round(np.asarray(controller.Ts) / self.period).astype(int))
+
+        for k in range(1, nit):
+            y[:, k] = plant(k - 1, u[:, k - 1])
+            due = k % ts_samples == 0
+            if batch:
+                u[:, k] = controller.calculate(r[k], y[:, k], mask=due)  # Loops not due hold u
+            elif due:
+                u[0, k] = controller.calculate(r[k], y[0, k])
+            else:
+                u[0, k] = u[0, k - 1]
+
+        e = r - y
+        e[:, 0] = 0.0
+        if not batch:
+            return t, u[0], y[0], e[0], r
+        return t, u, y, e, np.broadcast_to(r, (N, nit))
+
+    def fopdt(self, controller, lin_params, setpoint, duration, x0=25.0):
+        """
+        Closed loop with the FOPDT model y[k+1] = a*y[k] + b1*u[k-d] + b2*u[k-d-1]
+        args:
+            controller: Controllers or BatchControllers
+            lin_params: (K, tau, theta), scalars or arrays of N values
+            setpoint: constant setpoint or array with one value per iteration
+            duration: time in seconds
+            x0: initial temperature (steady state with u = 0)
+        returns:
+            t, u, y, e, r
+        """
+        a, b1, b2, d = TCLabFT.fopdt_coefficients(*lin_params, self.period)
+        a, b1, b2, d = (np.atleast_1d(c) for c in (a, b1, b2, d))
+        N = len(controller) if isinstance(controller, BatchControllers) else 1
+        nit = int(duration / self.period)
+        pad = int(d.max()) + 1
+        history = np.zeros((N, nit + pad))  # u shifted by pad, zeros before the start
+        rows = np.arange(N)
+        state = np.zeros(N)
+
+        def plant(k, uk):
+            nonlocal state
+            history[:, k + pad] = uk
+            state = a * state + b1 * history[rows, k + pad - d] + b2 * history[rows, k + pad - d - 1]
+            return x0 + state
+
+        return self._loop(controller, setpoint, duration, x0, plant)
+
+    def nonlinear(self, controller, U, alpha, setpoint, duration, model=None, x0=None, substeps=1):
+        """
+        Closed loop with the non linear energy balance (RK4 with the heater held)
+        args:
+            controller: Controllers or BatchControllers
+            U, alpha: parameters of the energy balance, scalars or arrays of N values
+            setpoint: constant setpoint or array with one value per iteration [degC]
+            duration: time in seconds
+            model: TCLabModel with the parameters (default values if None)
+            x0: initial temperature [degC] (model.x0 if None)
+            substeps: Runge-Kutta steps per period
+        returns:
+            t, u, y, e, r (temperatures in degC)
+        """
+        model = model if model is not None else TCLabModel()
+        p = model.nl_params
+        params = (p['m'], p['Cp'], p['A'], p['eps'], p['sigma'], p['Ta'])
+        N = len(controller) if isinstance(controller, BatchControllers) else 1
+        T = np.full(N, model.x0 if x0 is None else x0 + 273.15, dtype=float)
+        h = self.period / substeps
+
+        def plant(k, uk):
+            nonlocal T
+            T = energy_balance_rk4(T, uk, U, alpha, *params, h, substeps)
+            return T - 273.15
+
+        return self._loop(controller, setpoint, duration, T[0] - 273.15, plant)
+
+
+if __name__ == "__main__":
+    import time
+    from controllers import Controllers
+
+    sim = ClosedLoopSimulator(period=1.0)
+    lin_params = (0.6, 160.0, 12.5)
+    Kp, Ti, Td = Controllers.tune_ziegler_nichols(0.6, 12.5, 160.0, Ts=2.0, control_type='PI')
+
+    # One hour experiments
+    t0 = time.perf_counter()
+    t, u, y, e, r = sim.fopdt(Controllers(Kp, Ti, Td, 2.0, u_min=0, u_max=100), lin_params, 45.0, 3600)
+    t_fopdt = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    tn, un, yn, en, rn = sim.nonlinear(Controllers(Kp, Ti, Td, 2.0, u_min=0, u_max=100), 10.0, 0.01, 45.0, 3600,
+                                      x0=25.0)
+    t_nl = time.perf_counter() - t0
+    print(f"1 h closed loop: FOPDT {1000 * t_fopdt:.1f} ms (final y {y[-1]:.2f}), "
+          f"non linear {1000 * t_nl:.1f} ms (final y {yn[-1]:.2f})")
+
+    # 1000 loops in one call give the same results as the scalar controller
+    N = 1000
+    batch = BatchControllers(np.full(N, Kp), Ti, Td, 2.0, u_min=0, u_max=100)
+    t0 = time.perf_counter()
+    tb, ub, yb, eb, rb = sim.fopdt(batch, lin_params, 45.0, 3600)
+    print(f"{N} loops x 1 h: {1000 * (time.perf_counter() - t0):.1f} ms, "
+          f"max difference with the scalar loop {np.max(np.abs(yb - y)):.1e}")
@@ -8,8 +8,11 @@ from tclab_model import TCLabModel
 from tclab_ft import TCLabFT
 from tclab_parameters import TCLabParameters
 from tclab_stability import TCLabStability
+from tclab_plotter import LivePlot
+from tclab_bridge import GUIUpdateBridge
 from controllers import Controllers
 from tools import *
+from control.matlab import *
 import tkinter as tk
 import threading
 import pickle
@@ -36,6 +39,7 @@ class TCLabGUI:
         self.Gz = self.load_file('Gz')
         self.lin_params = self.load_file('lin_params')
         self.edo_params = self.load_file('edo_params')
+        self.estimation_cancel = None # Cancel token of the parameter estimation
         
         
         #================================================================================================
@@ -130,6 +134,10 @@ class TCLabGUI:
         self.toolbar_pv.update()
         self.canvas_pv.get_tk_widget().pack(fill=tk.BOTH, expand=True)
 
+        # Incremental plotting of the live data (blitting, decimation and limited redraw rate)
+        self.incremental_plot = True
+        self.live_plot = LivePlot(self.canvas_pv, [self.ax_pv, self.ax_mv], after=self.master.after)
+
         #================================================================================================
         #========  Create the connection buttons ======================================================
         #================================================================================================
@@ -365,6 +373,10 @@ class TCLabGUI:
         self.text_terminal.grid(row=0, column=0, sticky="nsew", padx=5, pady=5)
         self.text_terminal.insert(tk.END, "TCLab Terminal\n")
         self.text_terminal.insert(tk.END, "----------------\n")
+
+        # Queue of the updates sent by the test threads, drained periodically by Tk
+        self.gui_bridge = GUIUpdateBridge(self.master, self.update_graph, self.insert_terminal)
+        self.gui_bridge.start()
         
         
     def connect(self):
@@ -511,12 +523,49 @@ class TCLabGUI:
             self.text_terminal.insert(tk.END, "Wait for the optimization calculation...\n")
             self.text_terminal.see(tk.END)
 
-            pass
+            # Load the data [t, Q, T] and estimate U and alpha in a background thread
+            data = self.load_data()
+            if data is None:
+                raise ValueError("No data loaded.")
+            self.tclab_model.update_data(data)
+            self.tclab_model.set_x0(data[0, 2] + 273.15)
+            self.estimation_cancel = threading.Event()
+            threading.Thread(target=self.run_estimation, daemon=True).start()
         except:
             #unchecked the checkbox
             self.regression.set(False)
             self.toggle_regression()
 
+    def run_estimation(self):
+        """
+        Parallel estimation of the EDO parameters, reporting the progress in the terminal.
+        Runs in a worker thread: every widget update goes through gui_bridge
+        """
+        def progress(done, total, best_cost):
+            self.gui_bridge.put_line(f"Start {done}/{total}  best cost: {best_cost:.3f}")
+
+        try:
+            result = self.tclab_model.estimate_parallel(progress_callback=progress,
+                                                        cancel_event=self.estimation_cancel)
+        except Exception as e:
+            self.gui_bridge.put_line(f"Estimation failed: {e!r}")
+            self.gui_bridge.put_call(self.estimation_failed)
+            return
+        if result['U'] is None:
+            self.gui_bridge.put_line("Estimation cancelled, no result")
+            return
+        self.edo_params = {'U': result['U'], 'alpha': result['alpha']}
+        self.save_file('edo_params', self.edo_params)
+        status = "cancelled, best so far" if result['cancelled'] else "finished"
+        self.gui_bridge.put_line(f"Estimation {status}: U = {result['U']:.4f}, alpha = {result['alpha']:.6f}")
+
+    def estimation_failed(self):
+        """
+        Uncheck the regression after a failed parameter estimation (runs in the Tk thread)
+        """
+        self.regression.set(False)
+        self.toggle_regression()
+
     def regression_model_ft(self):
         """
         Regression model of the TCLab
@@ -526,7 +575,16 @@ class TCLabGUI:
             self.text_terminal.insert(tk.END, "Wait for the optimization calculation...\n")
             self.text_terminal.see(tk.END)
 
-            pass
+            # Load the data [t, Q, T] and identify the FOPDT parameters
+            data = self.load_data()
+            if data is None:
+                raise ValueError("No data loaded.")
+            self.tclab_ft.update_data(data)
+            self.tclab_ft.update_x0(data[0, 2])
+            fit = self.tclab_ft.identify()
+            self.lin_params = fit['params']
+            self.text_terminal.insert(tk.END, f"RMSE: {fit['rmse']:.3f} [°C]  R2: {fit['r2']:.4f}  ({fit['nfev']} evaluations)\n")
+            self.display_tf(self.lin_params)
 
             # if entry_sampling_time is not empty calculate discrete transfer function
             if self.entry_sampling_time.get():
@@ -652,7 +710,9 @@ class TCLabGUI:
                 tk.messagebox.showerror("Error", "Please enter the setpoint and duration.") 
     
     def stop(self):
-        pass
+        # Cancel a running parameter estimation
+        if self.estimation_cancel is not None:
+            self.estimation_cancel.set()
 
     def send(self):
         """
@@ -675,10 +735,10 @@ class TCLabGUI:
 
 
     def load_data(self):
-        # ask for the user to load the data in a txt file using np.loadtxt
+        # ask for the user to load the data in a txt file or in a binary bundle (header.json)
         filename = tk.filedialog.askopenfilename()
         if filename:
-            data = np.loadtxt(filename, delimiter=',', skiprows=1)     
+            data = DataSaver.load(filename)
             return data
         else:
             return None
@@ -702,6 +762,13 @@ class TCLabGUI:
         """
         Update the graph with new data from the TCLab device and the control action. 
         """
+        if self.incremental_plot:
+            # Only the data of the persistent lines changes, the redraw is rate limited
+            self.live_plot.set_data(0, label[0], time_data, temp_data, k, color[0])
+            self.live_plot.set_data(1, label[1], time_data, power_data, k, color[1])
+            self.live_plot.redraw()
+            return
+
         # Asegúrate de que los datos estén en el formato correcto, como listas o np.arrays
         if clear:
             self.ax_pv.clear()  # Limpia la gráfica actual de la variable controlada
@@ -721,29 +788,47 @@ class TCLabGUI:
         self.canvas_pv.draw()  # Actualiza el canvas
 
     def clear_graph(self):
+        self.live_plot.reset()
         self.ax_pv.clear() 
         self.ax_mv.clear()
+        # The live plot does not redraw the labels
+        self.ax_pv.set_ylabel('Temperature [C]')
+        self.ax_mv.set_ylabel('Power [%]')
+        self.ax_mv.set_xlabel('Time [s]')
 
-    def update_terminal(self, time_data, temp_data, power_data, k):
+    def terminal_line(self, time_data, temp_data, power_data, k):
         # Asegúrate de que los datos sean arrays de NumPy o listas y tengan al menos un elemento
         if (isinstance(time_data, np.ndarray) or isinstance(time_data, list)) and len(time_data) > 0 and \
         (isinstance(temp_data, np.ndarray) or isinstance(temp_data, list)) and len(temp_data) > 0 and \
         (isinstance(power_data, np.ndarray) or isinstance(power_data, list)) and len(power_data) > 0:
             # Solo actualiza con el último valor de cada lista o array
-            self.text_terminal.insert(tk.END, f"Time: {time_data[k]:6.1f} Temp: {temp_data[k]:6.2f} Power: {power_data[k]:6.2f}\n")
-            self.text_terminal.see(tk.END)  # Autoscroll to the bottom
-        else:
-            print("Data provided to update_terminal is not in the correct format.")
+            return f"Time: {time_data[k]:6.1f} Temp: {temp_data[k]:6.2f} Power: {power_data[k]:6.2f}\n"
+        print("Data provided to update_terminal is not in the correct format.")
+        return None
+
+    def insert_terminal(self, text):
+        self.text_terminal.insert(tk.END, text)
+        self.text_terminal.see(tk.END)  # Autoscroll to the bottom
+
+    def update_terminal(self, time_data, temp_data, power_data, k):
+        line = self.terminal_line(time_data, temp_data, power_data, k)
+        if line is not None:
+            self.insert_terminal(line)
 
 
     def update_data(self, time_data, temp_data, power_data, k):
-        self.master.after(1, self.update_graph, time_data, temp_data, power_data, k)
-        self.master.after(1, self.update_terminal, time_data, temp_data, power_data, k)
+        # Called from the test thread: the bridge coalesces the updates for the Tk thread
+        self.gui_bridge.put_graph('open_loop', time_data, temp_data, power_data, k)
+        line = self.terminal_line(time_data, temp_data, power_data, k)
+        if line is not None:
+            self.gui_bridge.put_terminal(line)
 
     def update_data_controller(self, time_data, temp_data, power_data, setpoint, k):
-        self.master.after(1, self.update_graph, time_data, setpoint, power_data, k, ['Setpoint', 'Heater Power'], ['--r', '-k'], False)
-        self.master.after(1, self.update_graph, time_data, temp_data, power_data, k, ['Temperature', 'Heater Power'], ['-k', '-k'], False)
-        self.master.after(1, self.update_terminal, time_data, temp_data, power_data, k)
+        self.gui_bridge.put_graph('setpoint', time_data, setpoint, power_data, k, ['Setpoint', 'Heater Power'], ['--r', '-k'], False)
+        self.gui_bridge.put_graph('temperature', time_data, temp_data, power_data, k, ['Temperature', 'Heater Power'], ['-k', '-k'], False)
+        line = self.terminal_line(time_data, temp_data, power_data, k)
+        if line is not None:
+            self.gui_bridge.put_terminal(line)
 
 
     def toggle_stability(self):
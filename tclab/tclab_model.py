@@ -1,12 +1,85 @@
 import sys
+import os
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.integrate import solve_ivp
-from scipy.optimize import minimize
-from tclab_class import InterfazTCLab
-from tclab_plotter import TCLabPlotter
-from tclab_parameters import TCLabParameters
-import tkinter as tk
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import Manager
+from tools import DataSaver
+
+try:
+    from numba import njit
+except ImportError:  # Numba is optional, the NumPy version is used without it
+    njit = None
+
+
+def energy_balance(T, Q, U, alpha, m, Cp, A, eps, sigma, Ta):
+    """
+    Right hand side of the heater energy balance (convection + radiation + heater power).
+    Works with scalars or NumPy arrays of temperatures.
+    """
+    return (U * A * (Ta - T) + eps * sigma * A * (Ta**4 - T**4) + alpha * Q) / (m * Cp)
+
+
+def energy_balance_jac(T, U, m, Cp, A, eps, sigma):
+    """
+    Derivative of the energy balance with respect to the temperature.
+    """
+    return -(U * A + 4.0 * eps * sigma * A * T**3) / (m * Cp)
+
+
+# Compile the energy balance when Numba is available
+if njit is not None:
+    energy_balance = njit(cache=True)(energy_balance)
+    energy_balance_jac = njit(cache=True)(energy_balance_jac)
+
+
+def energy_balance_rk4(T, Q, U, alpha, m, Cp, A, eps, sigma, Ta, h, n=1):
+    """
+    n classic Runge-Kutta steps of length h of the energy balance with the heater
+    power held. T, Q, U and alpha can be arrays to integrate many heaters at once.
+    """
+    args = (Q, U, alpha, m, Cp, A, eps, sigma, Ta)
+    for _ in range(n):
+        k1 = energy_balance(T, *args)
+        k2 = energy_balance(T + 0.5 * h * k1, *args)
+        k3 = energy_balance(T + 0.5 * h * k2, *args)
+        k4 = energy_balance(T + h * k3, *args)
+        T = T + h / 6.0 * (k1 + 2 * k2 + 2 * k3 + k4)
+    return T
+
+
+class _Cancelled(Exception):
+    """ Raised in the cost function to stop a fit when the estimation is cancelled """
+
+
+def _fit_start(x0, nl_params, t, Q, T, start, bounds, method, stop_event=None):
+    """
+    Fit U and alpha from one initial guess (runs in a worker process).
+    T is the measured temperature in degC. stop_event (shared with the parent, e.g. a
+    Manager().Event) is polled at every cost evaluation: when it is set the fit stops
+    and returns the best point evaluated so far.
+    returns:
+        x, cost, nfev, success, stopped
+    """
+    from scipy.optimize import minimize
+
+    model = TCLabModel(x0=x0, nl_params=nl_params)
+    best = {'x': np.asarray(start, dtype=float), 'fun': np.inf, 'nfev': 0}
+
+    def cost(p):
+        if stop_event is not None and stop_event.is_set():
+            raise _Cancelled
+        value = np.sum((model.simulate(t, Q, p[0], p[1], method=method) - 273.15 - T)**2)
+        best['nfev'] += 1
+        if value < best['fun']:
+            best['x'], best['fun'] = np.array(p, dtype=float), value
+        return value
+
+    try:
+        sol = minimize(cost, start, method='L-BFGS-B', bounds=bounds)
+    except _Cancelled:
+        return best['x'], float(best['fun']), best['nfev'], False, True
+    return sol.x, float(sol.fun), int(sol.nfev), bool(sol.success), False
+
 
 # Define the TCLabModel class to define the non linear model of the plant
 
@@ -47,15 +120,171 @@ class TCLabModel:
     def update_data(self, data):
         self.data = data
 
+    def rhs(self, t, x, Q, U, alpha):
+        """
+        Right hand side of the energy balance for solve_ivp
+        args:
+            t: time
+            x: temperature [K]
+            Q: heater power
+            U: heat transfer coefficient
+            alpha: heater factor
+        """
+        p = self.nl_params
+        return np.array([energy_balance(x[0], Q, U, alpha, p['m'], p['Cp'], p['A'], p['eps'], p['sigma'], p['Ta'])])
+
+    def jacobian(self, t, x, Q, U, alpha):
+        """
+        Analytic Jacobian of the energy balance for the implicit solvers (LSODA, Radau, BDF)
+        """
+        p = self.nl_params
+        return np.array([[energy_balance_jac(x[0], U, p['m'], p['Cp'], p['A'], p['eps'], p['sigma'])]])
+
+    def simulate(self, t, Q, U, alpha, method='LSODA'):
+        """
+        Simulate the non linear model with the heater power held constant between samples.
+        The solver is restarted only where the heater power changes.
+        args:
+            t: time vector
+            Q: heater power with the same length of t
+            U, alpha: parameters of the energy balance
+            method: solve_ivp method, the analytic Jacobian is used by the implicit methods
+        returns:
+            T: temperature [K] in the instants of t
+        """
+        from scipy.integrate import solve_ivp
+
+        t = np.asarray(t, dtype=float)
+        Q = np.asarray(Q, dtype=float)
+        options = {'jac': self.jacobian} if method in ('LSODA', 'Radau', 'BDF') else {}
+
+        T = np.empty(len(t))
+        T[0] = self.x0
+        # Segments [t[i], t[j]] where Q[i:j] is constant
+        changes = np.flatnonzero(np.diff(Q[:-1])) + 1
+        bounds = np.concatenate(([0], changes, [len(t) - 1]))
+        for i, j in zip(bounds[:-1], bounds[1:]):
+            sol = solve_ivp(self.rhs, [t[i], t[j]], [T[i]], t_eval=t[i + 1:j + 1], method=method,
+                            args=(Q[i], U, alpha), **options)
+            T[i + 1:j + 1] = sol.y[0]
+        return T
+
+    def estimate_parallel(self, data=None, n_starts=16, bounds=((1.0, 30.0), (0.001, 0.03)),
+                          seed=0, max_workers=None, progress_callback=None, cancel_event=None,
+                          method='LSODA'):
+        """
+        Estimate U and alpha with multi-start optimizations distributed in a process pool
+        args:
+            data: data from the TCLab [t, Q, T] with T in degC (uses self.data if None)
+            n_starts: number of initial guesses, drawn uniformly inside the bounds
+            bounds: ((U_min, U_max), (alpha_min, alpha_max))
+            seed: seed of the initial guesses, the result is deterministic for a given seed
+            max_workers: number of processes (os.cpu_count() if None)
+            progress_callback: function(done, total, best_cost) called after each start
+            cancel_event: object with is_set() (e.g. threading.Event) to stop the estimation,
+                          the starts not yet executed are cancelled and the running ones
+                          stop at their next cost evaluation, returning their best point
+            method: solve_ivp method for the simulations
+        returns:
+            result: dictionary with the best parameters, the cost and all the starts
+        """
+        if data is None:
+            data = self.data
+        if data is None:
+            raise ValueError("No data available for the estimation.")
+        data = np.asarray(data, dtype=float)
+        t, Q, T = data[:, 0], data[:, 1], data[:, 2]
+
+        rng = np.random.default_rng(seed)
+        low, high = np.array(bounds, dtype=float).T
+        starts = rng.uniform(low, high, size=(int(n_starts), 2))
+
+        results = []
+        cancelled = False
+        max_workers = max_workers or os.cpu_count()
+        # The fits running in the workers poll a shared event (a threading.Event can
+        # not cross processes), so a cancellation stops them within one cost evaluation
+        manager = Manager() if cancel_event is not None else None
+        stop_event = manager.Event() if manager is not None else None
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = {executor.submit(_fit_start, self.x0, self.nl_params, t, Q, T, start, bounds, method,
+                                           stop_event): i
+                           for i, start in enumerate(starts)}
+                pending = set(futures)
+                while pending:
+                    done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if future.cancelled():
+                            continue
+                        x, fun, nfev, success, stopped = future.result()
+                        results.append({'start': starts[futures[future]], 'U': x[0], 'alpha': x[1],
+                                        'cost': fun, 'nfev': nfev, 'success': success, 'stopped': stopped})
+                        if progress_callback is not None:
+                            progress_callback(len(results), len(starts), min(r['cost'] for r in results))
+                    if not cancelled and cancel_event is not None and cancel_event.is_set():
+                        # Drop the starts not yet executed, the running ones return their best point
+                        cancelled = True
+                        stop_event.set()
+                        for future in pending:
+                            future.cancel()
+        finally:
+            if manager is not None:
+                manager.shutdown()
+
+        results = [r for r in results if np.isfinite(r['cost'])]  # Stopped before any evaluation
+        if not results:
+            return {'U': None, 'alpha': None, 'cost': None, 'starts': results, 'cancelled': cancelled}
+        # Sort by cost (ties by start) so the result does not depend on the completion order
+        results.sort(key=lambda r: (r['cost'], tuple(r['start'])))
+        best = results[0]
+        return {'U': best['U'], 'alpha': best['alpha'], 'cost': best['cost'],
+                'starts': results, 'cancelled': cancelled}
+
     def load_data(self):
-        # ask for the user to load the data in a txt file using np.loadtxt
-        filename = tk.filedialog.askopenfilename()
+        # ask for the user to load the data in a txt file or in a binary bundle (header.json)
+        from tkinter import filedialog
+        filename = filedialog.askopenfilename()
         if filename:
-            data = np.loadtxt(filename, delimiter=',', skiprows=1)     
+            data = DataSaver.load(filename)
             return data
         else:
             return None
 
 if __name__ == "__main__":
+    import time
+    from tools import SignalGenerator
+
+    # Wall time per simulated second of the energy balance with different solvers
+    model = TCLabModel(x0=298)
+    t = np.arange(3600.0)
+    Q = SignalGenerator.create_prbs(0, 20, 50, 10, 50, len(t), 30)
+    U, alpha = 10.0, 0.01
+    print(f"Numba: {'enabled' if njit is not None else 'not available, using NumPy'}")
+    model.simulate(t[:10], Q[:10], U, alpha)  # Compile before timing
+    for method in ('RK45', 'LSODA', 'Radau', 'BDF'):
+        t0 = time.perf_counter()
+        T = model.simulate(t, Q, U, alpha, method=method)
+        elapsed = time.perf_counter() - t0
+        print(f"{method:6s}: {1e6 * elapsed / (t[-1] - t[0]):8.2f} us per simulated second "
+              f"(final temperature {T[-1] - 273.15:6.2f} degC)")
+
+    # Parallel estimation of U and alpha from simulated data
+    t = t[:900]
+    Q = Q[:900]
+    T_data = model.simulate(t, Q, 8.0, 0.012) - 273.15 + np.random.default_rng(1).normal(0, 0.1, len(t))
+    model.update_data(np.column_stack((t, Q, T_data)))
+    for workers in (1, os.cpu_count()):
+        t0 = time.perf_counter()
+        result = model.estimate_parallel(n_starts=8, max_workers=workers)
+        print(f"{workers:2d} workers: U = {result['U']:.3f}, alpha = {result['alpha']:.5f} "
+              f"in {time.perf_counter() - t0:.2f} s")
 
-    pass
+    # Cancelling stops the running fits within one cost evaluation
+    import threading
+    cancel = threading.Event()
+    threading.Timer(1.0, cancel.set).start()
+    t0 = time.perf_counter()
+    result = model.estimate_parallel(n_starts=8, cancel_event=cancel)
+    print(f"Cancelled after 1 s, returned in {time.perf_counter() - t0:.2f} s with {len(result['starts'])} starts "
+          f"(best cost {result['cost']}), cancelled: {result['cancelled']}")
@@ -1,3 +1,4 @@
+import time
 import matplotlib.pyplot as plt
 import numpy as np
 
@@ -92,6 +93,132 @@ class TCLabPlotter:
         plt.show()
 
 
+class LivePlot:
+    """
+    Incremental live plot for a canvas with several axes. The lines are persistent
+    Line2D artists updated with set_data, the static part of the figure is restored
+    from a cached background (blitting) and the history is decimated for display,
+    so the cost of a redraw does not grow with the length of the experiment.
+    The redraw rate is limited to one every min_interval seconds.
+    """
+
+    def __init__(self, canvas, axes, max_points=2000, min_interval=0.25, after=None):
+        """
+        Constructor of the class
+        args:
+            canvas: matplotlib canvas (e.g. FigureCanvasTkAgg)
+            axes: list of axes of the canvas figure
+            max_points: maximum number of points drawn for each line
+            min_interval: minimum time in seconds between two redraws
+            after: function(ms, callback) to schedule a trailing redraw (e.g. Tk after)
+        """
+        self.canvas = canvas
+        self.axes = list(axes)
+        self.max_points = max_points
+        self.min_interval = min_interval
+        self.after = after
+        self.lines = {}          # (axis index, label) -> Line2D
+        self.background = None
+        self.last_draw = 0.0
+        self.pending = False     # A trailing redraw is scheduled
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def reset(self):
+        """ Remove the lines of the live plot """
+        for (i, _), line in self.lines.items():
+            if line in self.axes[i].lines:  # The axes may have been cleared already
+                line.remove()
+        self.lines = {}
+        for ax in self.axes:
+            if ax.get_legend() is not None:
+                ax.get_legend().remove()
+        self.background = None
+
+    def set_data(self, ax_index, label, x, y, k=None, style='-b'):
+        """
+        Set the data of a line, creating it the first time
+        args:
+            ax_index: index of the axes in self.axes
+            label: label of the line (identifies the line)
+            x, y: data, only the first k points are plotted
+            style: matplotlib format string used when the line is created
+        """
+        key = (ax_index, label)
+        line = self.lines.get(key)
+        ax = self.axes[ax_index]
+        if line is None or line not in ax.lines:  # New line or axes cleared elsewhere
+            line, = ax.plot([], [], style, label=label, animated=True)
+            self.lines[key] = line
+            ax.legend(loc='upper left')
+            self.background = None
+        k = len(x) if k is None else k
+        step = max(1, -(-k // self.max_points))
+        xs = np.asarray(x[:k:step], dtype=float)
+        ys = np.asarray(y[:k:step], dtype=float)
+        if k > 0 and (k - 1) % step:
+            # Always show the last sample
+            xs = np.append(xs, x[k - 1])
+            ys = np.append(ys, y[k - 1])
+        line.set_data(xs, ys)
+
+    def redraw(self, force=False):
+        """
+        Redraw the lines if min_interval has passed since the last redraw (or force is True).
+        Returns True if the canvas was updated.
+        """
+        now = time.monotonic()
+        if not force and now - self.last_draw < self.min_interval:
+            if self.after is not None and not self.pending:
+                self.pending = True
+                delay = int(1000 * (self.min_interval - (now - self.last_draw))) + 1
+                self.after(delay, self._trailing_redraw)
+            return False
+        self.last_draw = now
+
+        if self._update_limits() or self.background is None:
+            # Axes changed: full redraw, the background is captured in the draw event
+            self.canvas.draw_idle()
+        else:
+            self.canvas.restore_region(self.background)
+            self._draw_lines()
+            self.canvas.blit(self.canvas.figure.bbox)
+        return True
+
+    def _trailing_redraw(self):
+        self.pending = False
+        self.redraw(force=True)
+
+    def _update_limits(self):
+        # Grow the limits with margin when the data leaves the axes
+        changed = False
+        for i, ax in enumerate(self.axes):
+            data = [line.get_data() for (j, _), line in self.lines.items() if j == i and len(line.get_xdata())]
+            if not data:
+                continue
+            x = np.concatenate([d[0] for d in data])
+            y = np.concatenate([d[1] for d in data])
+            x0, x1 = ax.get_xlim()
+            if x.min() < x0 or x.max() > x1:
+                ax.set_xlim(min(x.min(), x0), x.min() + 1.5 * max(x.max() - x.min(), 1e-9))
+                changed = True
+            y0, y1 = ax.get_ylim()
+            if y.min() < y0 or y.max() > y1:
+                margin = 0.1 * max(y.max() - y.min(), 1.0)
+                ax.set_ylim(y.min() - margin, y.max() + margin)
+                changed = True
+        return changed
+
+    def _draw_lines(self):
+        for (i, _), line in self.lines.items():
+            self.axes[i].draw_artist(line)
+
+    def _on_draw(self, event):
+        # Cache the static figure and paint the animated lines over it
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self._draw_lines()
+        self.canvas.blit(self.canvas.figure.bbox)
+
+
 # Example of usage
 if __name__ == "__main__":
 
@@ -0,0 +1,168 @@
+import time
+import numpy as np
+
+
+class LoopProfiler:
+    """
+    Opt-in instrumentation of the control loops. The duration of every phase of each
+    iteration is stored in microseconds in a compact uint32 ring buffer, and the
+    rolling percentiles, the maximum and the missed deadlines (iterations whose busy
+    time exceeds the period) can be queried during the run or written in a report,
+    together with jitter histograms of the busy time and of the period lateness
+    (duration of the whole iteration minus the period).
+
+    Usage in a loop:
+        profiler.begin()
+        ... read sensor ...
+        profiler.mark('read')
+        ... compute control ...
+        profiler.mark('control')
+        profiler.end()
+    """
+
+    def __init__(self, phases=('read', 'control', 'record', 'plot', 'wait'), period=1.0,
+                 capacity=100000, window=600, idle_phases=('wait',), report_file=None,
+                 clock=time.perf_counter_ns):
+        """
+        Constructor of the class
+        args:
+            phases: names of the phases of an iteration
+            period: loop period in seconds, used to count the missed deadlines
+            capacity: number of iterations kept in memory
+            window: number of recent iterations of the rolling statistics
+            idle_phases: phases not counted as busy time (e.g. sleeping)
+            report_file: file where finish() writes the report (None to skip)
+            clock: clock in nanoseconds
+        """
+        self.phases = tuple(phases)
+        self.index = {name: i for i, name in enumerate(self.phases)}
+        self.period = period
+        self.capacity = int(capacity)
+        self.window = int(window)
+        self.busy = np.array([name not in idle_phases for name in self.phases])
+        self.report_file = report_file
+        self.clock = clock
+        self.durations = np.zeros((self.capacity, len(self.phases)), dtype=np.uint32)  # [us]
+        self.count = 0
+        self.missed = 0
+        self._row = np.zeros(len(self.phases), dtype=np.int64)  # [ns]
+        self._t = None
+
+    def begin(self):
+        """ Start an iteration """
+        self._row[:] = 0
+        self._t = self.clock()
+
+    def mark(self, phase):
+        """ Close the current phase: the time since the last mark is added to it """
+        now = self.clock()
+        self._row[self.index[phase]] += now - self._t
+        self._t = now
+
+    def end(self):
+        """ Store the iteration """
+        row = self._row // 1000
+        self.durations[self.count % self.capacity] = np.minimum(row, np.iinfo(np.uint32).max)
+        self.count += 1
+        if row[self.busy].sum() > self.period * 1e6:
+            self.missed += 1
+
+    def recent(self, n=None):
+        """ Durations [us] of the last n iterations (window if None) """
+        n = self.window if n is None else n
+        n = min(n, self.count, self.capacity)
+        idx = np.arange(self.count - n, self.count) % self.capacity
+        return self.durations[idx]
+
+    def summary(self, n=None):
+        """
+        Rolling statistics in milliseconds of each phase and of the busy time
+        over the last n iterations (window if None)
+        """
+        data = self.recent(n).astype(np.float64) / 1000.0
+        stats = {}
+        if len(data) == 0:
+            return stats
+        columns = list(zip(self.phases, data.T)) + [('busy', data[:, self.busy].sum(axis=1))]
+        for name, values in columns:
+            p50, p99 = np.percentile(values, [50, 99])
+            stats[name] = {'p50': p50, 'p99': p99, 'max': values.max(), 'mean': values.mean()}
+        return stats
+
+    def histogram(self, n=None, bins=10):
+        """
+        Jitter histograms in milliseconds over the last n iterations (window if None)
+        args:
+            n: number of recent iterations
+            bins: number of bins of each histogram (np.histogram)
+        returns:
+            dict with the (counts, edges) of the busy time ('busy') and of the lateness
+            of the period ('lateness', negative if the iteration was shorter)
+        """
+        data = self.recent(n).astype(np.float64) / 1000.0
+        if len(data) == 0:
+            return {}
+        busy = data[:, self.busy].sum(axis=1)
+        lateness = data.sum(axis=1) - 1000.0 * self.period
+        return {'busy': np.histogram(busy, bins=bins), 'lateness': np.histogram(lateness, bins=bins)}
+
+    def report(self, n=None, bins=10):
+        """ Text report of the rolling statistics, the missed deadlines and the jitter histograms """
+        lines = [f"Loop profile: {self.count} iterations, period {1000 * self.period:.1f} ms, "
+                 f"missed deadlines {self.missed}",
+                 f"{'phase':>10s} {'p50 [ms]':>10s} {'p99 [ms]':>10s} {'max [ms]':>10s} {'mean [ms]':>10s}"]
+        for name, s in self.summary(n).items():
+            lines.append(f"{name:>10s} {s['p50']:10.3f} {s['p99']:10.3f} {s['max']:10.3f} {s['mean']:10.3f}")
+        for name, (counts, edges) in self.histogram(n, bins).items():
+            lines.append(f"Histogram of the {name} [ms]:")
+            top = max(counts.max(), 1)
+            for count, low, high in zip(counts, edges[:-1], edges[1:]):
+                lines.append(f"{low:10.3f} {high:10.3f} {count:8d} {'#' * -(-40 * count // top)}")  # 40 chars bar
+        return '\n'.join(lines)
+
+    def dump(self, filename):
+        """ Write the report of the whole run (iterations in memory) and the raw durations """
+        data = self.recent(self.capacity)
+        with open(filename, 'w') as f:
+            f.write(self.report(self.capacity) + '\n\n')
+            np.savetxt(f, data, fmt='%d', delimiter=',',
+                       header=', '.join(f'{name} (us)' for name in self.phases), comments='')
+
+    def finish(self):
+        """ Called at the end of the run: write the report if report_file is defined """
+        if self.report_file is not None:
+            self.dump(self.report_file)
+
+
+class NullProfiler:
+    """ Profiler that does nothing, used when the instrumentation is disabled """
+    def begin(self):
+        pass
+
+    def mark(self, phase):
+        pass
+
+    def end(self):
+        pass
+
+    def finish(self):
+        pass
+
+
+if __name__ == "__main__":
+    # Profile of a simulated loop with a slow phase every 100 iterations
+    profiler = LoopProfiler(period=0.002)
+    for k in range(1000):
+        profiler.begin()
+        time.sleep(0.0002)
+        profiler.mark('read')
+        sum(range(2000 if k % 100 else 200000))
+        profiler.mark('control')
+        profiler.mark('record')
+        profiler.mark('plot')
+        time.sleep(0.0005)
+        profiler.mark('wait')
+        profiler.end()
+    print(profiler.report())
+    hist = profiler.histogram()
+    assert all(counts.sum() == min(profiler.count, profiler.window) for counts, _ in hist.values())
@@ -0,0 +1,130 @@
+import threading
+import numpy as np
+
+
+class DataRecorder:
+    """
+    Columnar ring buffer of fixed memory to record the experiments of the TCLab.
+    A background thread appends the recorded rows to a text file (same format as
+    save_txt) while the experiment runs, so the memory does not grow with the
+    duration and the data is on disk up to the last flush.
+    """
+
+    def __init__(self, filename, columns=('Time (sec)', 'Heater 1 (%)', 'Temperature 1 (degC)'),
+                 capacity=4096, flush_interval=5.0):
+        """
+        Constructor of the class
+        args:
+            filename: text file where the data is appended (it is overwritten at the start)
+            columns: names of the columns, written in the header
+            capacity: number of rows kept in memory
+            flush_interval: seconds between the writes of the background thread
+        """
+        self.filename = filename
+        self.columns = tuple(columns)
+        self.capacity = int(capacity)
+        self.flush_interval = flush_interval
+        self.buffer = np.zeros((self.capacity, len(self.columns)))
+        self.count = 0     # Rows appended since the start
+        self.flushed = 0   # Rows written to the file
+
+        self._lock = threading.Lock()        # Protects the buffer and the counters
+        self._write_lock = threading.Lock()  # Serializes the writes to the file
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        with open(self.filename, 'w') as file:
+            file.write(', '.join(self.columns) + '\n')
+
+    def start(self):
+        """ Start the background flusher """
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        """ Stop the background flusher and write the remaining rows """
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def append(self, *values):
+        """
+        Record one row (one value per column)
+        """
+        with self._lock:
+            full = self.count - self.flushed >= self.capacity
+        if full:
+            # The flusher is behind: write now instead of overwriting unsaved rows
+            self.flush()
+        with self._lock:
+            self.buffer[self.count % self.capacity] = values
+            self.count += 1
+            pending = self.count - self.flushed
+        if pending >= self.capacity // 2:
+            self._wakeup.set()
+
+    def window(self, n=None):
+        """
+        Return the last n rows (all the rows in memory if None) in chronological order
+        """
+        with self._lock:
+            available = min(self.count, self.capacity)
+            n = available if n is None else min(int(n), available)
+            return self._rows(self.count - n, self.count)
+
+    def flush(self):
+        """
+        Append the rows not yet written to the file
+        """
+        with self._write_lock:
+            with self._lock:
+                start, stop = self.flushed, self.count
+                rows = self._rows(start, stop)
+            if len(rows) == 0:
+                return
+            with open(self.filename, 'a') as file:
+                np.savetxt(file, rows, delimiter=',')
+            with self._lock:
+                self.flushed = stop
+
+    def _rows(self, start, stop):
+        # Copy the rows [start, stop) of the whole record from the ring buffer
+        idx = np.arange(start, stop) % self.capacity
+        return self.buffer[idx]
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+if __name__ == "__main__":
+    import os
+    import time
+    import tempfile
+
+    # Record 24 hours of 1 Hz data with a buffer of 10 minutes
+    filename = os.path.join(tempfile.gettempdir(), 'recorder_test.txt')
+    n = 24 * 3600
+    t0 = time.perf_counter()
+    with DataRecorder(filename, capacity=600, flush_interval=0.05) as recorder:
+        for k in range(n):
+            recorder.append(k, 50.0, 25.0 + 0.001 * k)
+    elapsed = time.perf_counter() - t0
+    data = np.loadtxt(filename, delimiter=',', skiprows=1)
+    print(f"{len(data)} rows recorded in {elapsed:.2f} s with {recorder.buffer.nbytes / 1024:.1f} kB of buffer")
+    assert len(data) == n and np.array_equal(data[:, 0], np.arange(n))
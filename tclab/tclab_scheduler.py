@@ -0,0 +1,121 @@
+import time
+
+
+class LoopScheduler:
+    """
+    Drift-free periodic scheduler for the TCLab loops. The deadlines are multiples of
+    the period from the start instant on a monotonic clock, so the sleep errors do not
+    accumulate and wall-clock jumps do not affect the schedule.
+
+    Policies when an iteration overruns by one period or more:
+        'skip': the missed ticks are skipped and the loop continues on the original grid
+        'burst': the missed ticks run back-to-back (no sleep) until the loop catches up
+        'stretch': the schedule restarts from the late instant (the grid is shifted)
+    """
+
+    POLICIES = ('skip', 'burst', 'stretch')
+
+    def __init__(self, period=1.0, policy='skip', clock=time.perf_counter_ns, sleep=time.sleep, spin=0.0):
+        """
+        Constructor of the class
+        args:
+            period: loop period in seconds (sub-second values allowed)
+            policy: 'skip', 'burst' or 'stretch'
+            clock: monotonic clock in nanoseconds
+            sleep: sleep function in seconds
+            spin: seconds before each deadline spent busy-waiting instead of sleeping
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(f"Invalid policy '{policy}'. Use one of {self.POLICIES}.")
+        if period <= 0:
+            raise ValueError("The period must be positive.")
+        self.period = period
+        self.period_ns = int(round(period * 1e9))
+        self.policy = policy
+        self.clock = clock
+        self.sleep = sleep
+        self.spin_ns = int(spin * 1e9)
+        self.start()
+
+    def start(self):
+        """ Restart the schedule and the statistics from now """
+        self.t0 = self.clock()
+        self.deadline = self.t0
+        self.ticks = 0        # Iterations waited
+        self.overruns = 0     # Iterations late by one period or more
+        self.skipped = 0      # Ticks skipped by the 'skip' policy
+        self._n = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._max = 0
+        return self
+
+    def elapsed(self):
+        """ Seconds since the start """
+        return (self.clock() - self.t0) / 1e9
+
+    def wait(self):
+        """
+        Wait until the next deadline
+        returns:
+            elapsed time in seconds since the start when the wait ends
+        """
+        self.deadline += self.period_ns
+        self.ticks += 1
+
+        now = self.clock()
+        remaining = self.deadline - now - self.spin_ns
+        if remaining > 0:
+            self.sleep(remaining / 1e9)
+        now = self.clock()
+        while now < self.deadline:
+            now = self.clock()
+
+        # Lateness of the wake up with respect to the deadline (jitter)
+        late = now - self.deadline
+        self._record(late)
+        if late >= self.period_ns:
+            self.overruns += 1
+            if self.policy == 'skip':
+                missed = late // self.period_ns
+                self.deadline += missed * self.period_ns
+                self.skipped += missed
+            elif self.policy == 'stretch':
+                self.deadline = now
+            # 'burst' keeps the deadlines, the next waits return immediately
+        return (now - self.t0) / 1e9
+
+    def _record(self, late):
+        # Running mean and variance of the lateness (Welford)
+        self._n += 1
+        delta = late - self._mean
+        self._mean += delta / self._n
+        self._m2 += delta * (late - self._mean)
+        self._max = max(self._max, late)
+
+    def stats(self):
+        """
+        Jitter statistics in seconds
+        """
+        std = (self._m2 / (self._n - 1)) ** 0.5 if self._n > 1 else 0.0
+        return {
+            'ticks': self.ticks,
+            'jitter_mean': self._mean / 1e9,
+            'jitter_std': std / 1e9,
+            'jitter_max': self._max / 1e9,
+            'overruns': self.overruns,
+            'skipped': self.skipped
+        }
+
+
+if __name__ == "__main__":
+    # Jitter of a 10 ms loop with a heavy iteration every 50 ticks
+    for policy in LoopScheduler.POLICIES:
+        scheduler = LoopScheduler(period=0.01, policy=policy)
+        for k in range(200):
+            if k % 50 == 49:
+                time.sleep(0.035)
+            scheduler.wait()
+        stats = scheduler.stats()
+        print(f"{policy:8s} elapsed {scheduler.elapsed():.3f} s  jitter mean {1e3 * stats['jitter_mean']:.3f} ms "
+              f"max {1e3 * stats['jitter_max']:.3f} ms  overruns {stats['overruns']}  skipped {stats['skipped']}")
@@ -0,0 +1,258 @@
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, wait
+from tclab_scheduler import LoopScheduler
+from tools import SignalGenerator
+
+
+class RigSession:
+    """
+    One experiment on one TCLab board of the rack. The heater sequence of the open
+    loop tests is computed at the start, the closed loop tests call the controller
+    every controller.Ts seconds. Every iteration runs in the worker of the rig and
+    takes one tick of the scheduler (period seconds).
+    """
+
+    def __init__(self, name, lab, experiment='step', duration=600, step_test=50.0, prbs_params=None,
+                 setpoint=None, controller=None, period=1.0):
+        """
+        Constructor of the class
+        args:
+            name: name of the rig
+            lab: device with the T1/T2 properties and the Q1()/Q2() methods
+                 (tclab_cae, TCLabSimulator or the lab of an InterfazTCLab)
+            experiment: 'step', 'prbs' or 'closed_loop'
+            duration: time in seconds of the test ('step' and 'closed_loop')
+            step_test: value of the step test
+            prbs_params: parameters of SignalGenerator.create_prbs ('prbs')
+            setpoint: temperature setpoint ('closed_loop')
+            controller: Controllers instance ('closed_loop')
+            period: tick of the scheduler in seconds (set by SessionManager.add_rig),
+                    the PRBS sequence is given in ticks
+        """
+        self.name = name
+        self.lab = getattr(lab, 'lab', lab)  # Accept an InterfazTCLab
+        self.experiment = experiment
+        self.setpoint = setpoint
+        self.controller = controller
+        self.period = period
+        ticks = int(round(duration / period))
+
+        if experiment == 'step':
+            self.Q = np.zeros(ticks + 1)
+            self.Q[int(round(10 / period)):] = step_test  # Step after 10 seconds
+        elif experiment == 'prbs':
+            if prbs_params is None:
+                raise ValueError("For PRBS test, 'prbs_params' must be provided.")
+            self.Q = SignalGenerator.create_prbs(*prbs_params)
+        elif experiment == 'closed_loop':
+            if setpoint is None or controller is None:
+                raise ValueError("For closed loop test, 'setpoint' and 'controller' must be provided.")
+            self.Q = None
+            self.duration = ticks  # In ticks
+        else:
+            raise ValueError("Invalid 'experiment' provided. Use 'step', 'prbs' or 'closed_loop'.")
+
+        self.u = 0.0
+        self.ts_samples = 1  # Ticks per controller sample, set by the manager
+        self.status = 'ready'
+        self.health = {
+            'iterations': 0,     # Ticks completed by the worker
+            'missed': 0,         # Ticks skipped because the previous iteration was still running
+            'errors': 0,         # Iterations that raised an exception
+            'last_error': None,
+            'io_mean': 0.0,      # Mean duration of an iteration [s]
+            'io_max': 0.0,       # Maximum duration of an iteration [s]
+            'last_T': None,      # Last temperature read [degC]
+            'last_time': None    # Time of the last sample [s]
+        }
+
+    @property
+    def length(self):
+        """ Number of samples of the experiment """
+        return len(self.Q) if self.Q is not None else self.duration + 1
+
+    def step(self, k, t):
+        """
+        Run the iteration k of the experiment at the time t
+        returns:
+            (t, heater, temperature)
+        """
+        t0 = time.perf_counter()
+        T = self.lab.T1
+        if self.Q is not None:
+            self.u = float(self.Q[k])
+        elif k % self.ts_samples == 0:
+            self.u = self.controller.calculate(self.setpoint, T)
+        self.lab.Q1(self.u)
+        elapsed = time.perf_counter() - t0
+
+        h = self.health
+        h['iterations'] += 1
+        h['io_mean'] += (elapsed - h['io_mean']) / h['iterations']
+        h['io_max'] = max(h['io_max'], elapsed)
+        h['last_T'] = T
+        h['last_time'] = t
+        return t, self.u, T
+
+
+class SessionManager:
+    """
+    Headless orchestration of the experiments of a rack of TCLab boards. A single
+    LoopScheduler gives the tick of all the rigs, each rig runs its iteration in its
+    own worker thread (one serial port per thread) so a slow board does not delay the
+    others, and the samples of all the rigs go to one DataRecorder with the columns
+    (Time, Rig, Heater, Temperature).
+    """
+
+    COLUMNS = ('Time (sec)', 'Rig', 'Heater 1 (%)', 'Temperature 1 (degC)')
+
+    def __init__(self, recorder=None, scheduler=None, lockstep=False):
+        """
+        Constructor of the class
+        args:
+            recorder: DataRecorder with the columns COLUMNS (no recording if None)
+            scheduler: LoopScheduler shared by the rigs (1 s period if None)
+            lockstep: wait for the iterations of all the rigs before each tick instead of
+                      skipping the busy rigs. Required with virtual clocks (e.g. the
+                      scheduler of TCLabSimulator), where a tick takes no real time
+        """
+        self.recorder = recorder
+        self.lockstep = lockstep
+        self.scheduler = scheduler if scheduler is not None else LoopScheduler(period=1.0)
+        self.rigs = []
+        self.stop_requested = False
+
+    def add_rig(self, name, lab, **experiment):
+        """
+        Add a rig to the session (see RigSession for the experiment arguments)
+        returns:
+            RigSession
+        """
+        experiment.setdefault('period', self.scheduler.period)
+        rig = RigSession(name, lab, **experiment)
+        self.rigs.append(rig)
+        return rig
+
+    def stop(self):
+        """ Request the end of the session (thread safe) """
+        self.stop_requested = True
+
+    def run(self, callback=None):
+        """
+        Run the experiments of all the rigs until the longest one finishes
+        args:
+            callback: function(k, t, samples) called at every tick with the samples
+                      {name: (t, heater, temperature)} received in the tick
+        returns:
+            {name: array [n, 3] with the columns time, heater and temperature}
+        """
+        self.stop_requested = False
+        n = max(rig.length for rig in self.rigs)
+        data = {rig.name: [] for rig in self.rigs}
+        executors = [ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'rig-{rig.name}') for rig in self.rigs]
+        futures = [None] * len(self.rigs)
+        for rig in self.rigs:
+            rig.status = 'running'
+            if rig.controller is not None:
+                rig.ts_samples = max(1, int(round(rig.controller.Ts / self.scheduler.period)))
+
+        self.scheduler.start()
+        try:
+            for k in range(n):
+                t = self.scheduler.elapsed()
+                # Launch the iteration of every rig whose worker is free
+                for i, rig in enumerate(self.rigs):
+                    if rig.status != 'running':
+                        continue
+                    if k >= rig.length:
+                        rig.status = 'done'
+                        continue
+                    if futures[i] is not None:
+                        rig.health['missed'] += 1
+                        continue
+                    futures[i] = executors[i].submit(rig.step, k, t)
+
+                if self.lockstep:
+                    wait([future for future in futures if future is not None])
+                    samples = self._collect(futures, data)
+                    self.scheduler.wait()
+                else:
+                    self.scheduler.wait()
+                    # Collect the iterations completed before the next tick
+                    samples = self._collect(futures, data)
+                if callback is not None:
+                    callback(k, t, samples)
+                if self.stop_requested:
+                    break
+        finally:
+            for executor in executors:
+                executor.shutdown(wait=True)
+            self._collect(futures, data)
+            for rig in self.rigs:
+                try:
+                    rig.lab.Q1(0)  # Turn off the heaters of the whole rack
+                except Exception as e:
+                    rig.health['last_error'] = repr(e)
+                if rig.status == 'running':
+                    rig.status = 'done' if len(data[rig.name]) >= rig.length else 'stopped'
+            if self.recorder is not None:
+                self.recorder.flush()
+
+        return {name: np.array(rows).reshape(-1, 3) for name, rows in data.items()}
+
+    def _collect(self, futures, data):
+        # Store the results of the finished iterations and free their workers
+        samples = {}
+        for i, rig in enumerate(self.rigs):
+            future = futures[i]
+            if future is None or not future.done():
+                continue
+            futures[i] = None
+            try:
+                samples[rig.name] = future.result()
+            except Exception as e:
+                rig.health['errors'] += 1
+                rig.health['last_error'] = repr(e)
+                continue
+            data[rig.name].append(samples[rig.name])
+            if self.recorder is not None:
+                t, u, T = samples[rig.name]
+                self.recorder.append(t, i, u, T)
+        return samples
+
+    def health(self):
+        """
+        Loop health of every rig
+        returns:
+            {name: dict with status, iterations, missed, errors, io_mean, io_max, ...}
+            and the jitter statistics of the shared scheduler in 'scheduler'
+        """
+        report = {rig.name: dict(rig.health, status=rig.status) for rig in self.rigs}
+        report['scheduler'] = self.scheduler.stats()
+        return report
+
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+    from tclab_simulator import SimulatedLab
+    from tclab_recorder import DataRecorder
+
+    # Rack of 8 simulated boards with 20 ms of serial latency, 100 ms tick
+    filename = os.path.join(tempfile.gettempdir(), 'session_test.txt')
+    with DataRecorder(filename, columns=SessionManager.COLUMNS) as recorder:
+        session = SessionManager(recorder=recorder, scheduler=LoopScheduler(period=0.1))
+        for i in range(8):
+            session.add_rig(f'rig{i}', SimulatedLab(latency=0.01), experiment='step', duration=15,
+                            step_test=10.0 * (i + 1))
+        t0 = time.perf_counter()
+        results = session.run()
+        elapsed = time.perf_counter() - t0
+
+    for name, h in session.health().items():
+        if name != 'scheduler':
+            print(f"{name}: {h['status']} {h['iterations']} it, missed {h['missed']}, "
+                  f"errors {h['errors']}, io max {1000 * h['io_max']:.1f} ms, T {h['last_T']:.2f}")
+    print(f"Session of {len(results)} rigs in {elapsed:.2f} s, "
+          f"{len(np.loadtxt(filename, delimiter=',', skiprows=1))} rows recorded")
@@ -0,0 +1,178 @@
+import time
+import numpy as np
+from tclab_model import TCLabModel, energy_balance_rk4
+from tclab_scheduler import LoopScheduler
+
+
+class SimulatedLab:
+    """
+    Simulated TCLab device with the same interface of tclab_cae (T1, T2, Q1(), Q2(),
+    close()), so the loops of InterfazTCLab can run without hardware. Each heater is
+    a first order system K/(tau*s + 1) over the ambient temperature that evolves with
+    the real time, and every access waits `latency` seconds like a serial round trip.
+    """
+
+    def __init__(self, Ta=25.0, K=0.6, tau=160.0, latency=0.0, clock=time.monotonic):
+        """
+        Constructor of the class
+        args:
+            Ta: ambient temperature [degC]
+            K: gain [degC/%]
+            tau: time constant [s]
+            latency: seconds spent by every read or write
+            clock: clock in seconds
+        """
+        self.Ta = Ta
+        self.K = K
+        self.tau = tau
+        self.latency = latency
+        self.clock = clock
+        self.temperatures = np.array([Ta, Ta], dtype=float)
+        self.heaters = np.zeros(2)
+        self.last_time = self.clock()
+
+    def _advance(self):
+        # Exact response of the first order systems with the heaters held since the last access
+        now = self.clock()
+        a = np.exp(-(now - self.last_time) / self.tau)
+        steady = self.Ta + self.K * self.heaters
+        self.temperatures = steady + (self.temperatures - steady) * a
+        self.last_time = now
+
+    def _io(self):
+        if self.latency > 0:
+            time.sleep(self.latency)
+        self._advance()
+
+    @property
+    def T1(self):
+        self._io()
+        return float(self.temperatures[0])
+
+    @property
+    def T2(self):
+        self._io()
+        return float(self.temperatures[1])
+
+    def Q1(self, value=None):
+        self._io()
+        if value is not None:
+            self.heaters[0] = min(max(value, 0.0), 100.0)
+        return float(self.heaters[0])
+
+    def Q2(self, value=None):
+        self._io()
+        if value is not None:
+            self.heaters[1] = min(max(value, 0.0), 100.0)
+        return float(self.heaters[1])
+
+    def close(self):
+        self.heaters[:] = 0.0
+
+
+class TCLabSimulator:
+    """
+    Deterministic simulated TCLab device (T1, T2, Q1(), Q2(), close()) driven by the
+    non linear energy balance of TCLabModel. The time is virtual: it only advances
+    when sleep() is called, so a loop paced by a LoopScheduler built with scheduler()
+    runs the experiment as fast as the CPU allows. The measurement noise comes from a
+    seeded generator, so two runs with the same seed give the same data.
+    """
+
+    def __init__(self, model=None, U=10.0, alpha=0.01, noise=0.0, seed=0, dt=1.0, T0=None):
+        """
+        Constructor of the class
+        args:
+            model: TCLabModel with the parameters of the energy balance (default values if None)
+            U: heat transfer coefficient
+            alpha: heater factor
+            noise: standard deviation of the temperature measurements [degC]
+            seed: seed of the measurement noise
+            dt: maximum integration step [s]
+            T0: initial temperature of both heaters [degC] (ambient temperature if None)
+        """
+        self.model = model if model is not None else TCLabModel()
+        self.U = U
+        self.alpha = alpha
+        self.noise = noise
+        self.dt = dt
+        self.rng = np.random.default_rng(seed)
+        p = self.model.nl_params
+        self._params = (p['m'], p['Cp'], p['A'], p['eps'], p['sigma'], p['Ta'])
+        T0 = p['Ta'] if T0 is None else T0 + 273.15
+        self.states = np.array([T0, T0], dtype=float)  # [K]
+        self.heaters = np.zeros(2)
+        self.time_ns = 0  # Virtual time
+
+    # Virtual clock, same signatures of time.perf_counter_ns and time.sleep
+    def clock(self):
+        return self.time_ns
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def scheduler(self, period=1.0, policy='skip'):
+        """ LoopScheduler that runs on the virtual clock of the simulator """
+        return LoopScheduler(period=period, policy=policy, clock=self.clock, sleep=self.sleep)
+
+    @property
+    def time(self):
+        """ Virtual time in seconds """
+        return self.time_ns / 1e9
+
+    def advance(self, seconds):
+        """ Integrate the energy balance (RK4, heaters held) during `seconds` of virtual time """
+        step_ns = int(round(seconds * 1e9))
+        if step_ns <= 0:
+            return
+        n = max(1, int(np.ceil(step_ns / (self.dt * 1e9))))
+        h = step_ns / 1e9 / n
+        self.states = energy_balance_rk4(self.states, self.heaters, self.U, self.alpha, *self._params, h, n)
+        self.time_ns += step_ns
+
+    def _measure(self, i):
+        value = self.states[i] - 273.15
+        if self.noise > 0:
+            value += self.noise * self.rng.standard_normal()
+        return float(value)
+
+    @property
+    def T1(self):
+        return self._measure(0)
+
+    @property
+    def T2(self):
+        return self._measure(1)
+
+    def Q1(self, value=None):
+        if value is not None:
+            self.heaters[0] = min(max(value, 0.0), 100.0)
+        return float(self.heaters[0])
+
+    def Q2(self, value=None):
+        if value is not None:
+            self.heaters[1] = min(max(value, 0.0), 100.0)
+        return float(self.heaters[1])
+
+    def close(self):
+        self.heaters[:] = 0.0
+
+
+if __name__ == "__main__":
+    # One hour step test at 1 Hz in virtual time
+    def step_test(seed):
+        lab = TCLabSimulator(noise=0.1, seed=seed)
+        scheduler = lab.scheduler(period=1.0)
+        T = np.zeros(3600)
+        for k in range(3600):
+            T[k] = lab.T1
+            lab.Q1(50.0 if k >= 10 else 0.0)
+            scheduler.wait()
+        return T, lab.time
+
+    t0 = time.perf_counter()
+    T, virtual = step_test(seed=1)
+    elapsed = time.perf_counter() - t0
+    print(f"{virtual:.0f} s of experiment simulated in {elapsed:.3f} s ({virtual / elapsed:.0f}x real time), "
+          f"final temperature {T[-1]:.2f} degC")
+    assert np.array_equal(T, step_test(seed=1)[0])
@@ -5,6 +5,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 from tclab_parameters import TCLabParameters
 from control.matlab import *
+from tools import AnalysisCache, StepMetrics
 
 #Define TCLabStability class to analyse the system by LGR and Bode 
 class TCLabStability:
@@ -35,6 +36,23 @@ class TCLabStability:
         """ Calculate the closed-loop response for a given gain K. """
         pass
 
+    def closed_loop_metrics(self, gains, n_samples=500, duration=None):
+        """
+        Step response metrics of the closed loop for a batch of gains, without plots
+        args:
+            gains: array of N gains K
+            n_samples: samples of each response
+            duration: simulated time if the system is continuous (automatic if None)
+        returns:
+            dictionary of arrays with N values (StepMetrics.NAMES), measured against the
+            final value of each response
+        """
+        if self.sys is None:
+            raise ValueError("System not defined.")
+        num, den, dt = AnalysisCache.split_tf(self.sys)
+        t, y, u = StepMetrics.gain_responses(num, den, gains, dt=dt, n_samples=n_samples, duration=duration)
+        return StepMetrics.compute(t, y, r=1.0, y0=0.0, u=u, relative_to='final')
+
     def display_responses(self, pv, mv):
         """ Display the process and control responses. """
         ty, y = pv
@@ -0,0 +1,132 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from controllers import Controllers, BatchControllers
+from tclab_closed_loop import ClosedLoopSimulator
+from tools import AnalysisCache, StepMetrics
+
+RULES = ('ziegler_nichols', 'cohen_coon', 'iae', 'iaet')
+CONTROL_TYPES = ('P', 'PI', 'PID')
+CRITERIA = ('iae', 'ise', 'itae', 'overshoot', 'settling_time', 'rise_time', 'effort')
+
+
+def _simulate_candidates(lin_params, candidates, setpoint, duration, x0, u_min, u_max, period):
+    """
+    Simulate a chunk of candidates (rule, type, Ts, Kp, Ti, Td) in one BatchControllers
+    run (runs in a worker process)
+    """
+    Kp, Ti, Td, Ts = (np.array([c[i] for c in candidates], dtype=float) for i in (3, 4, 5, 2))
+    controller = BatchControllers(Kp, Ti, Td, Ts, u_min=u_min, u_max=u_max)
+    sim = ClosedLoopSimulator(period=period)
+    t, u, y, e, r = sim.fopdt(controller, lin_params, setpoint, duration, x0=x0)
+    metrics = StepMetrics.compute(t, y, r=setpoint, y0=x0, u=u)
+    # The P and PD loops keep a steady state error: their rise, overshoot and settling
+    # are measured against their final value (the error integrals against the setpoint)
+    offset = ~np.isfinite(Ti)
+    if offset.any():
+        final = StepMetrics.compute(t, y[offset], r=setpoint, y0=x0, relative_to='final')
+        for name in ('rise_time', 'peak_time', 'overshoot', 'settling_time'):
+            metrics[name][offset] = final[name]
+    return [{name: float(values[i]) for name, values in metrics.items()} for i in range(len(candidates))]
+
+
+def tuning_sweep(lin_params, rules=RULES, control_types=CONTROL_TYPES, Ts_grid=(1.0, 2.0, 5.0, 10.0),
+                 step=20.0, duration=None, x0=25.0, u_min=0.0, u_max=100.0, period=1.0,
+                 criterion='iae', max_workers=None):
+    """
+    Compare the tuning rules of Controllers by simulating a setpoint step with every
+    rule x control type x sampling time against the FOPDT model. The candidates are
+    split in chunks simulated in parallel (one BatchControllers per process). The
+    simulated metrics are kept in AnalysisCache.shared, so repeating a sweep of the same
+    model (e.g. ranked by another criterion) does not simulate again.
+    args:
+        lin_params: identified (K, tau, theta)
+        rules: tuning rules, names of the Controllers.tune_<rule> methods
+        control_types: 'P', 'PI' and/or 'PID'
+        Ts_grid: controller sampling times (multiples of period)
+        step: setpoint step from x0
+        duration: simulated time (6*(tau + theta), at least 600 s, if None)
+        x0: initial temperature
+        u_min, u_max: saturation of the heater
+        period: loop period of the simulation
+        criterion: column used to rank the table (one of CRITERIA)
+        max_workers: number of processes (os.cpu_count() if None, 0 to run here)
+    returns:
+        table: list of dictionaries (rule, type, Ts, Kp, Ti, Td and the metrics)
+               sorted by the criterion, unstable or unsettled candidates last
+    """
+    if criterion not in CRITERIA:
+        raise ValueError(f"Invalid criterion '{criterion}'. Use one of {CRITERIA}.")
+    K, tau, theta = (float(p) for p in lin_params)
+    if duration is None:
+        duration = max(600.0, 6 * (tau + theta))
+    setpoint = x0 + step
+
+    candidates = []
+    for rule in rules:
+        tune = getattr(Controllers, f'tune_{rule}')
+        for control_type in control_types:
+            for Ts in Ts_grid:
+                Kp, Ti, Td = tune(K, theta, tau, Ts, control_type=control_type)
+                candidates.append((rule, control_type, float(Ts), float(Kp), float(Ti), float(Td)))
+
+    workers = (os.cpu_count() or 1) if max_workers is None else max_workers
+    options = (setpoint, duration, x0, u_min, u_max, period)
+
+    def simulate():
+        if workers <= 1 or len(candidates) < 2:
+            return _simulate_candidates(lin_params, candidates, *options)
+        # Round robin split, so every chunk gets a mix of fast and slow sampling times
+        n_chunks = min(workers, len(candidates))
+        chunks = [candidates[i::n_chunks] for i in range(n_chunks)]
+        with ProcessPoolExecutor(max_workers=n_chunks) as executor:
+            futures = [executor.submit(_simulate_candidates, lin_params, chunk, *options) for chunk in chunks]
+            metrics = [None] * len(candidates)
+            for i, future in enumerate(futures):
+                metrics[i::n_chunks] = future.result()
+        return metrics
+
+    key = AnalysisCache.key([K], [tau, 1.0], delay=theta)
+    metrics = AnalysisCache.shared.get(key, ('tuning_sweep', tuple(candidates), options), simulate)
+
+    table = []
+    for (rule, control_type, Ts, Kp, Ti, Td), m in zip(candidates, metrics):
+        table.append(dict(rule=rule, type=control_type, Ts=Ts, Kp=Kp, Ti=Ti, Td=Td, **m))
+    table.sort(key=lambda row: (not np.isfinite(row['settling_time']), np.nan_to_num(row[criterion], nan=np.inf)))
+    return table
+
+
+def format_table(table, criterion='iae'):
+    """ Text table of the sweep results """
+    lines = [f"{'rule':>16s} {'type':>4s} {'Ts':>5s} {'Kp':>8s} {'Ti':>8s} {'Td':>7s} {'IAE':>9s} {'ISE':>10s} "
+             f"{'ITAE':>11s} {'OS [%]':>7s} {'ts [s]':>7s} {'effort':>8s}   ranked by {criterion}"]
+    for row in table:
+        lines.append(f"{row['rule']:>16s} {row['type']:>4s} {row['Ts']:5.1f} {row['Kp']:8.3f} {row['Ti']:8.2f} "
+                     f"{row['Td']:7.2f} {row['iae']:9.1f} {row['ise']:10.1f} {row['itae']:11.0f} "
+                     f"{row['overshoot']:7.1f} {row['settling_time']:7.0f} {row['effort']:8.1f}")
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    import time
+
+    lin_params = (0.6, 160.0, 12.5)
+    t0 = time.perf_counter()
+    table = tuning_sweep(lin_params, max_workers=0)
+    t_serial = time.perf_counter() - t0
+    AnalysisCache.shared.clear()
+    t0 = time.perf_counter()
+    table_parallel = tuning_sweep(lin_params)
+    t_parallel = time.perf_counter() - t0
+    np.testing.assert_equal(table, table_parallel)  # nan rise times of the loops that never reach 90 %
+    # P candidates: steady state error of the positional P loop, step/(1 + K*Kp)
+    for row in table:
+        if row['type'] == 'P':
+            expected = 20.0 / (1 + lin_params[0] * row['Kp'])
+            assert abs(row['steady_state_error'] - expected) < 1e-6 and np.isfinite(row['settling_time']), row
+    t0 = time.perf_counter()
+    table_cached = tuning_sweep(lin_params, criterion='itae')
+    t_cached = time.perf_counter() - t0
+    print(format_table(table))
+    print(f"{len(table)} candidates: {t_serial:.2f} s in one process, {t_parallel:.2f} s with {os.cpu_count()} processes, "
+          f"{1000 * t_cached:.1f} ms ranked again by ITAE (cache {AnalysisCache.shared.info()})")
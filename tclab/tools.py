@@ -5,10 +5,15 @@ Created on Fri Sep  8 00:11:27 2023
 @author: Sergio
 """
 
-import matplotlib.pyplot as plt
-from control.matlab import *
 import numpy as np
 from math import pi
+import os
+import re
+import json
+import warnings
+import hashlib
+import threading
+from collections import OrderedDict
 
 def margin_plot(sys):
     """margin_plot(sysdata)
@@ -20,12 +25,11 @@ def margin_plot(sys):
 
     Parameters
     ----------
-    sysdata : LTI system or (mag, phase, omega) sequence
-        sys : StateSpace or TransferFunction
-            Linear SISO system representing the loop transfer function
-        mag, phase, omega : sequence of array_like
-            Input magnitude, phase (in deg.), and frequencies (rad/sec) from
-            bode frequency response data
+    sys : TransferFunction
+        Linear SISO system representing the loop transfer function
+
+    The crossovers are computed by FrequencyResponse.margins on the exact frequency
+    response (refined roots, not limited by the grid of the Bode plot).
 
     Returns
     -------
@@ -53,8 +57,12 @@ def margin_plot(sys):
     
     by: Sergio Andres Castaño Giraldo
     """
+    import matplotlib.pyplot as plt
+    from control.matlab import bode
+
     mag, phase, omega = bode(sys)
-    gm, pm, Wcg, Wcp = margin(sys)
+    margins = FrequencyResponse.from_tf(sys).margins()
+    gm, pm, Wcg, Wcp = (float(margins[name][0]) for name in ('gm', 'pm', 'wcg', 'wcp'))
     plt.subplot(211)
     plt.scatter(Wcg, -20*np.log10(gm), color ='r')
     plt.plot((Wcg, Wcg), (-20*np.log10(gm),0), '-r', linewidth=3 )
@@ -71,32 +79,1054 @@ def margin_plot(sys):
     return gm, pm, Wcg, Wcp
 
 class DataSaver:
+    # Binary experiment bundle: a directory with one .npy file per column and a JSON header
+    BUNDLE_HEADER = 'header.json'
+
     @staticmethod
     def save_txt(t, u1, y1, filename='data.txt'):
         data = np.vstack((t,u1,y1)).T
         top = 'Time (sec), Heater 1 (%), Temperature 1 (degC)'
         np.savetxt(filename, data, delimiter=',', header=top, comments='')
 
+    @staticmethod
+    def save_bundle(dirname, columns, names=('Time', 'Heater 1', 'Temperature 1'), units=('sec', '%', 'degC'),
+                    Ts=None, metadata=None):
+        """
+        Save an experiment in the binary bundle format
+        args:
+            dirname: directory of the bundle (created if it does not exist)
+            columns: sequence of arrays with the same length (e.g. t, u1, y1)
+            names, units: name and unit of each column
+            Ts: sampling time
+            metadata: dictionary serializable to JSON (controller parameters, setpoints, ...)
+        """
+        os.makedirs(dirname, exist_ok=True)
+        header = {'format': 'tclab-npy-bundle', 'version': 1, 'Ts': Ts,
+                  'metadata': metadata or {}, 'columns': []}
+        rows = None
+        for i, (column, name, unit) in enumerate(zip(columns, names, units)):
+            column = np.ascontiguousarray(column, dtype=np.float64)
+            rows = len(column) if rows is None else rows
+            if len(column) != rows:
+                raise ValueError("All the columns must have the same length.")
+            file = f'col{i}.npy'
+            np.save(os.path.join(dirname, file), column)
+            header['columns'].append({'name': name, 'unit': unit, 'file': file})
+        header['rows'] = rows or 0
+        with open(os.path.join(dirname, DataSaver.BUNDLE_HEADER), 'w') as f:
+            json.dump(header, f, indent=2)
+
+    @staticmethod
+    def load_bundle(dirname, mmap=True):
+        """
+        Load an experiment bundle
+        args:
+            dirname: directory of the bundle or path of its header.json
+            mmap: memory-map the columns instead of reading them
+        returns:
+            columns: list of arrays (read-only memory maps if mmap is True)
+            header: dictionary with the names, units, Ts and metadata
+        """
+        if os.path.basename(dirname) == DataSaver.BUNDLE_HEADER:
+            dirname = os.path.dirname(dirname)
+        with open(os.path.join(dirname, DataSaver.BUNDLE_HEADER)) as f:
+            header = json.load(f)
+        mode = 'r' if mmap else None
+        columns = [np.load(os.path.join(dirname, c['file']), mmap_mode=mode) for c in header['columns']]
+        if 'rows' in header:
+            columns = [column[:header['rows']] for column in columns]  # Rows written, not the allocated ones
+        return columns, header
+
+    @staticmethod
+    def load(filename):
+        """
+        Load an experiment as a 2D array [t, u, y, ...] from a text file (np.loadtxt)
+        or from a binary bundle (directory or its header.json)
+        """
+        if os.path.isdir(filename) or os.path.basename(filename) == DataSaver.BUNDLE_HEADER:
+            columns, _ = DataSaver.load_bundle(filename)
+            return np.column_stack(columns)
+        return np.loadtxt(filename, delimiter=',', skiprows=1)
+
+    @staticmethod
+    def convert_txt(filename, dirname, Ts=None, metadata=None, chunk_rows=1000000):
+        """
+        Convert a text experiment ('Time (sec), Heater 1 (%), Temperature 1 (degC)')
+        to a binary bundle, reading the file in chunks of chunk_rows rows
+        """
+        with open(filename, 'rb') as f:
+            lines = sum(block.count(b'\n') for block in iter(lambda: f.read(1 << 24), b''))
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                lines += 1  # Last line without end of line
+        rows = lines - 1
+
+        with open(filename) as f:
+            # Names and units from the header "Name (unit), ..."
+            names, units = [], []
+            for field in f.readline().split(','):
+                match = re.match(r'\s*(.*?)\s*\((.*)\)\s*$', field)
+                names.append(match.group(1) if match else field.strip())
+                units.append(match.group(2) if match else '')
+
+            os.makedirs(dirname, exist_ok=True)
+            files = [f'col{i}.npy' for i in range(len(names))]
+            columns = [np.lib.format.open_memmap(os.path.join(dirname, file), mode='w+',
+                                                 dtype=np.float64, shape=(rows,)) for file in files]
+            start = 0
+            while start < rows:
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', UserWarning)  # Blank lines, handled below
+                    chunk = np.loadtxt(f, delimiter=',', max_rows=min(chunk_rows, rows - start), ndmin=2)
+                if len(chunk) == 0:
+                    break
+                for i, column in enumerate(columns):
+                    column[start:start + len(chunk)] = chunk[:, i]
+                start += len(chunk)
+            for column in columns:
+                column.flush()
+            del columns
+
+        if start < rows:
+            # Blank lines were counted as rows: rewrite the columns with the rows read
+            for file in files:
+                path = os.path.join(dirname, file)
+                allocated = np.load(path, mmap_mode='r')
+                column = np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=np.float64, shape=(start,))
+                column[:] = allocated[:start]
+                column.flush()
+                del column, allocated
+                os.replace(path + '.tmp', path)
+
+        header = {'format': 'tclab-npy-bundle', 'version': 1, 'Ts': Ts, 'metadata': metadata or {},
+                  'columns': [{'name': n, 'unit': u, 'file': file} for n, u, file in zip(names, units, files)],
+                  'rows': start}
+        with open(os.path.join(dirname, DataSaver.BUNDLE_HEADER), 'w') as f:
+            json.dump(header, f, indent=2)
+
 
 class SamplingTime:
-    
+    """
+    Sampling time from the bandwidth wb of the system: the first frequency where the
+    magnitude falls 3 dB below the static gain, of the open loop or of the closed loop
+    with unit feedback. The recommended range is 8 to 12 samples per period of wb,
+    Ts in [2*pi/(12*wb), 2*pi/(8*wb)], and Ts is its center. wb is found on the exact
+    response of FrequencyResponse (dead time included, no Pade approximation): each
+    loop is bracketed doubling the frequency and the bracket refined by regula falsi,
+    so N loops are evaluated at once and no Bode grid is needed.
+
+        Ts, ts_small, ts_big = SamplingTime.calculate(G, delay=theta, closed_loop=True)
+        ts = SamplingTime.fopdt(K, tau, theta)   # arrays with one value per model
+    """
+
+    LEVEL = 1 / np.sqrt(2)  # -3 dB
+
     @staticmethod
-    def calculate(sys):
-        h = feedback(sys, 1)
-        mag, phase, w = bode(sys,plot=False)
-        
-        mWc = 0.707 
-        index_wc = np.where(mag >=  mWc)
-        wc = w[index_wc[0][-1]]
-        wmin = 8 * wc
-        wmax = 12 * wc
-        ts_small = 2*pi / (wmax)
-        ts_big = 2*pi / (wmin)
-        return (ts_small + ts_big)/2, ts_small, ts_big
-   
-    
+    def bandwidth(loops, closed_loop=False, level=LEVEL, w_min=1e-6, w_max=None):
+        """
+        -3 dB bandwidth of the loops
+        args:
+            loops: FrequencyResponse with N loops
+            closed_loop: bandwidth of L/(1 + L) instead of L
+            level: magnitude relative to the static gain (1/sqrt(2) is -3 dB)
+            w_min, w_max: search range in rad/s (w_max: 0.999 of the Nyquist frequency
+                          if discrete, 1e5 if continuous and None)
+        returns:
+            wb: array with N frequencies in rad/s, nan when the magnitude is already below
+                the level at w_min (e.g. integrators in open loop) or stays above it
+                up to w_max
+        """
+        if w_max is None:
+            w_max = 0.999 * np.pi / loops.dt if loops.dt is not None else 1e5
+
+        def magnitude(w, rows):
+            L = loops.response(w, rows)
+            return np.abs(L / (1 + L)) if closed_loop else np.abs(L)
+
+        rows = np.arange(loops.n)
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            reference = np.log(level * magnitude(np.full(loops.n, 1e-12 * w_min), rows))
+            f = lambda w, active: np.log(magnitude(w, rows[active])) - reference[active]
+
+            wb = np.full(loops.n, np.nan)
+            lo = np.full(loops.n, float(w_min))
+            f_lo = f(lo, np.ones(loops.n, dtype=bool))
+            active = np.isfinite(reference) & (f_lo > 0)
+            hi, f_hi = lo.copy(), f_lo.copy()
+            found = np.zeros(loops.n, dtype=bool)
+            while active.any():
+                w = np.minimum(2 * lo[active], w_max)
+                fw = f(w, active)
+                below = fw <= 0
+                idx = np.flatnonzero(active)
+                hi[idx], f_hi[idx] = w, fw
+                found[idx[below]] = True
+                # Brackets closed, or the search reached w_max above the level
+                active[idx[below | (w >= w_max) | ~np.isfinite(fw)]] = False
+                keep = idx[~below]
+                lo[keep], f_lo[keep] = w[~below], fw[~below]
+
+            if found.any():
+                x = _refine_roots(lambda x, a: f(10**x, np.flatnonzero(found)[a]),
+                                  np.log10(lo[found]), np.log10(hi[found]), f_lo[found], f_hi[found])
+                wb[found] = 10**x
+        return wb
+
+    @staticmethod
+    def recommend(loops, closed_loop=False, level=LEVEL):
+        """
+        Sampling time range of the loops from their bandwidth
+        returns:
+            dictionary of arrays with N values: wb, Ts, ts_small and ts_big
+        """
+        wb = SamplingTime.bandwidth(loops, closed_loop=closed_loop, level=level)
+        ts_small = 2 * pi / (12 * wb)
+        ts_big = 2 * pi / (8 * wb)
+        return {'wb': wb, 'Ts': (ts_small + ts_big) / 2, 'ts_small': ts_small, 'ts_big': ts_big}
+
+    @staticmethod
+    def fopdt(K, tau, theta=0.0, closed_loop=False, **controller):
+        """
+        Sampling times of first order plus dead time models (arrays or scalars). In open
+        loop and without controller the bandwidth is exact, wb = sqrt(1/level^2 - 1)/tau.
+        """
+        if not closed_loop and not controller:
+            wb = np.sqrt(SamplingTime.LEVEL**-2 - 1) / np.atleast_1d(np.asarray(tau, dtype=float))
+            ts_small = 2 * pi / (12 * wb)
+            ts_big = 2 * pi / (8 * wb)
+            return {'wb': wb, 'Ts': (ts_small + ts_big) / 2, 'ts_small': ts_small, 'ts_big': ts_big}
+        return SamplingTime.recommend(FrequencyResponse.fopdt(K, tau, theta, **controller), closed_loop=closed_loop)
+
+    @staticmethod
+    def calculate(sys, delay=0.0, closed_loop=False):
+        """
+        Sampling time of a SISO python-control transfer function (cached in
+        AnalysisCache.shared)
+        args:
+            sys: transfer function
+            delay: dead time in seconds
+            closed_loop: use the bandwidth of feedback(sys, 1)
+        returns:
+            Ts, ts_small, ts_big
+        """
+        num, den, dt = AnalysisCache.split_tf(sys)
+
+        def compute():
+            ts = SamplingTime.recommend(FrequencyResponse(*AnalysisCache.normalize(num, den), delay=delay, dt=dt),
+                                        closed_loop=closed_loop)
+            if not np.isfinite(ts['wb'][0]):
+                raise ValueError("The -3 dB bandwidth of the system was not found.")
+            return float(ts['Ts'][0]), float(ts['ts_small'][0]), float(ts['ts_big'][0])
+
+        return AnalysisCache.shared.get(AnalysisCache.key(num, den, dt, delay), ('sampling_time', closed_loop), compute)
+
+
+def polyval_rows(coefficients, x):
+    """
+    Evaluate polynomials (highest power first) with Horner's rule.
+    args:
+        coefficients: 1D array (one polynomial) or 2D array (N, m) with one polynomial per row
+        x: values, broadcast against the N rows (e.g. shape (N, W) or (W,))
+    """
+    coefficients = np.atleast_2d(coefficients)
+    result = np.zeros(np.broadcast_shapes(x.shape, coefficients.shape[:1] + (1,) * (x.ndim - 1)), dtype=complex)
+    for c in coefficients.T:
+        result = result * x + c.reshape((-1,) + (1,) * (x.ndim - 1))
+    return result
+
+
+def _refine_roots(f, lo, hi, f_lo, f_hi, iterations=60, tol=1e-12):
+    """
+    Vectorized Illinois (modified regula falsi) refinement of many brackets at once.
+    f(x, active) evaluates the function of the brackets selected by the boolean array
+    active in the points x. The brackets must have f_lo and f_hi of opposite sign.
+    """
+    lo, hi, f_lo, f_hi = (np.array(v, dtype=float) for v in (lo, hi, f_lo, f_hi))
+    x = lo.copy()
+    side = np.zeros(lo.shape, dtype=int)
+    active = np.ones(lo.shape, dtype=bool)
+    for _ in range(iterations):
+        if not active.any():
+            break
+        a, b, fa, fb = lo[active], hi[active], f_lo[active], f_hi[active]
+        xa = (a * fb - b * fa) / (fb - fa)
+        xa = np.where(np.isfinite(xa) & (xa > a) & (xa < b), xa, 0.5 * (a + b))
+        fx = f(xa, active)
+        x[active] = xa
+        left = np.sign(fx) == np.sign(fa)
+        # Move the end with the same sign, halve the other value if it stays twice (Illinois)
+        s = side[active]
+        a = np.where(left, xa, a)
+        fa = np.where(left, fx, np.where(s == -1, fa / 2, fa))
+        b = np.where(left, b, xa)
+        fb = np.where(left, np.where(s == 1, fb / 2, fb), fx)
+        lo[active], hi[active], f_lo[active], f_hi[active] = a, b, fa, fb
+        side[active] = np.where(left, 1, -1)
+        done = (fx == 0) | (b - a <= tol * np.maximum(1.0, np.abs(xa)))
+        idx = np.flatnonzero(active)
+        active[idx[done]] = False
+    return x
+
+
+def _best_per_row(rows, score, k):
+    """ Boolean mask of the k entries with the highest score of each row """
+    if len(rows) == 0:
+        return np.zeros(0, dtype=bool)
+    order = np.lexsort((-score, rows))
+    sorted_rows = rows[order]
+    first = np.searchsorted(sorted_rows, sorted_rows, side='left')
+    keep = np.zeros(len(rows), dtype=bool)
+    keep[order[np.arange(len(rows)) - first < k]] = True
+    return keep
+
+
+class FrequencyResponse:
+    """
+    Exact frequency response of N loops L = C * G * exp(-s*delay) evaluated at once,
+    without plotting and without approximating the dead time. G is a rational transfer
+    function (continuous, or discrete with sampling time dt) and C an optional PID in
+    series: ideal PID Kp*(1 + 1/(Ti*s) + Td*s) in continuous time, or the velocity form
+    of Controllers (q0 + q1*z^-1 + q2*z^-2)/(1 - z^-1) in discrete time.
+
+        fr = FrequencyResponse.fopdt(K, tau, theta, Kp=Kp, Ti=Ti, Td=Td)
+        margins = fr.margins()   # gm, pm, wcg, wcp, dm arrays with one value per loop
+    """
+
+    def __init__(self, num, den, delay=0.0, dt=None, Kp=None, Ti=None, Td=None):
+        """
+        Constructor of the class
+        args:
+            num, den: coefficients of G (highest power first), 1D (shared by the loops)
+                      or 2D (N, m) with one polynomial per loop
+            delay: dead time in seconds, scalar or N values
+            dt: sampling time of a discrete G and controller (None: continuous)
+            Kp, Ti, Td: PID parameters, scalars or N values (Kp None: no controller)
+        """
+        self.num = np.atleast_2d(np.asarray(num, dtype=float))
+        self.den = np.atleast_2d(np.asarray(den, dtype=float))
+        self.dt = dt
+        self.Kp = None if Kp is None else np.asarray(Kp, dtype=float)
+        self.Ti = np.asarray(np.inf if Ti is None else Ti, dtype=float)
+        self.Td = np.asarray(0.0 if Td is None else Td, dtype=float)
+        self.delay = np.asarray(delay, dtype=float)
+        params = [self.num[:, 0], self.den[:, 0], self.delay, self.Ti, self.Td] + ([self.Kp] if Kp is not None else [])
+        self.n = max(np.broadcast_shapes(*(np.shape(p) for p in params)) or (1,))
+
+    @classmethod
+    def fopdt(cls, K, tau, theta, **controller):
+        """ Loops with the first order plus dead time model K*exp(-theta*s)/(tau*s + 1) """
+        K, tau = np.broadcast_arrays(np.asarray(K, dtype=float), np.asarray(tau, dtype=float))
+        num = K.reshape(-1, 1)
+        den = np.column_stack((tau.reshape(-1), np.ones(tau.size)))
+        return cls(num, den, delay=theta, **controller)
+
+    @classmethod
+    def from_tf(cls, sys, delay=0.0, **controller):
+        """ Loop of a SISO python-control transfer function """
+        dt = sys.dt
+        if dt is True:  # Discrete with unspecified sampling time
+            dt = 1.0
+        elif not dt:
+            dt = None
+        return cls(np.asarray(sys.num[0][0]), np.asarray(sys.den[0][0]), delay=delay, dt=dt, **controller)
+
+    def _rows(self, value, rows):
+        # Values of a per-loop parameter for the selected rows, shaped to broadcast
+        value = np.asarray(value)
+        if value.ndim == 0:
+            return value
+        value = np.broadcast_to(value, (self.n,) + value.shape[1:])
+        return value[rows]
+
+    def response(self, w, rows=None):
+        """
+        Complex frequency response
+        args:
+            w: frequencies in rad/s, a grid (W,) shared by the loops, or an array with the
+               same shape of rows (one frequency per selected loop)
+            rows: indices of the loops to evaluate (all the loops if None)
+        returns:
+            L: complex array (N, W) for a grid, or with the shape of rows
+        """
+        w = np.asarray(w, dtype=float)
+        if rows is None:
+            rows = np.arange(self.n)
+            w = np.broadcast_to(w, (self.n,) + w.shape)
+        def col(value):
+            # Per-loop values as a column that broadcasts against w
+            return value if np.ndim(value) == 0 else np.reshape(value, (-1,) + (1,) * (w.ndim - 1))
+
+        x = np.exp(1j * w * self.dt) if self.dt is not None else 1j * w
+
+        num = np.atleast_2d(self._rows(self.num, rows)) if self.num.shape[0] > 1 else self.num
+        den = np.atleast_2d(self._rows(self.den, rows)) if self.den.shape[0] > 1 else self.den
+        L = polyval_rows(num, x) / polyval_rows(den, x)
+        if self.Kp is not None:
+            Kp, Ti, Td = (col(self._rows(p, rows)) for p in (self.Kp, self.Ti, self.Td))
+            if self.dt is None:
+                L = L * Kp * (1 + 1 / (Ti * x) + Td * x)
+            else:
+                Ts = self.dt
+                q0 = Kp * (1 + Ts / Ti + Td / Ts)
+                q1 = -Kp * (1 + 2 * Td / Ts)
+                q2 = Kp * Td / Ts
+                zi = 1 / x
+                L = L * (q0 + q1 * zi + q2 * zi**2) / (1 - zi)
+        delay = col(self._rows(self.delay, rows))
+        return L * np.exp(-1j * w * delay)
+
+    def bode(self, w):
+        """
+        Magnitude [dB] and phase [deg] (unwrapped along w) of the loops, no plot
+        returns:
+            mag_db (N, W), phase_deg (N, W), w
+        """
+        L = self.response(w)
+        return 20 * np.log10(np.abs(L)), np.degrees(np.unwrap(np.angle(L), axis=-1)), np.asarray(w)
+
+    def default_grid(self, n_grid=1000):
+        """ Logarithmic grid of frequencies (up to the Nyquist frequency if discrete) """
+        w_max = 0.999 * np.pi / self.dt if self.dt is not None else 1e5
+        return np.logspace(-6, np.log10(w_max), n_grid)
+
+    def margins(self, w=None, candidates=3):
+        """
+        Stability margins of every loop. The crossovers are located on the grid w and
+        refined by regula falsi on the exact response, so their accuracy does not depend
+        on the grid. With several crossovers the smallest margin is returned; only the
+        `candidates` most critical brackets of each loop on the grid are refined (the
+        dead time gives a crossover every pi/theta rad/s).
+        args:
+            w: frequency grid in rad/s (default_grid() if None)
+            candidates: brackets refined per loop and crossover type
+        returns:
+            dictionary of arrays with N values:
+                gm: gain margin (inf without phase crossover), gm_db in dB
+                pm: phase margin in degrees (inf without gain crossover)
+                wcg: phase crossover frequency, where the gain margin is measured
+                wcp: gain crossover frequency, where the phase margin is measured
+                dm: delay margin pm/wcp in seconds (in samples of dt if discrete)
+        """
+        w = self.default_grid() if w is None else np.asarray(w, dtype=float)
+        logw = np.log10(w)
+        L = self.response(w)
+        N = self.n
+
+        def brackets(f_grid, valid, score):
+            # (row, left index) of the sign changes of f_grid, the best `candidates` of each row
+            change = (np.sign(f_grid[:, :-1]) * np.sign(f_grid[:, 1:]) < 0) & valid
+            rows, idx = np.nonzero(change)
+            keep = _best_per_row(rows, score[rows, idx], candidates)
+            return rows[keep], idx[keep]
+
+        def distance_to_180(phase):
+            return np.abs(np.mod(phase, 2 * np.pi) - np.pi)
+
+        # Gain crossovers: log|L| = 0, the most critical has the phase closest to -180
+        g = np.log(np.abs(L))
+        d180 = distance_to_180(np.angle(L))
+        rows, idx = brackets(g, True, -np.minimum(d180[:, :-1], d180[:, 1:]))
+        x = _refine_roots(lambda x, a: np.log(np.abs(self.response(10**x, rows[a]))),
+                          logw[idx], logw[idx + 1], g[rows, idx], g[rows, idx + 1])
+        wc = 10**x
+        phase = np.degrees(np.angle(self.response(wc, rows))) if len(rows) else np.zeros(0)
+        pm_all = np.mod(phase + 360.0, 360.0) - 180.0  # 180 + phase in [-180, 180)
+        pm = np.full(N, np.inf)
+        wcp = np.full(N, np.nan)
+        best = _best_per_row(rows, -np.abs(pm_all), 1)
+        pm[rows[best]], wcp[rows[best]] = pm_all[best], wc[best]
+
+        # Phase crossovers: Im(L) = 0 with Re(L) < 0, the most critical has the largest |L|
+        im = L.imag
+        valid = (L.real[:, :-1] < 0) | (L.real[:, 1:] < 0)
+        magnitude = np.abs(L)
+        rows, idx = brackets(im, valid, np.maximum(magnitude[:, :-1], magnitude[:, 1:]))
+        x = _refine_roots(lambda x, a: self.response(10**x, rows[a]).imag,
+                          logw[idx], logw[idx + 1], im[rows, idx], im[rows, idx + 1])
+        w180 = 10**x
+        L180 = self.response(w180, rows) if len(rows) else np.zeros(0, dtype=complex)
+        negative = L180.real < 0
+        rows, w180, L180 = rows[negative], w180[negative], L180[negative]
+        gm = np.full(N, np.inf)
+        wcg = np.full(N, np.nan)
+        best = _best_per_row(rows, np.abs(L180), 1)
+        gm[rows[best]], wcg[rows[best]] = 1 / np.abs(L180[best]), w180[best]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dm = np.where(np.isfinite(pm), np.radians(pm) / wcp, np.inf)
+            if self.dt is not None:
+                dm = dm / self.dt
+            gm_db = 20 * np.log10(gm)
+        return {'gm': gm, 'gm_db': gm_db, 'pm': pm, 'wcg': wcg, 'wcp': wcp, 'dm': dm}
+
+
+class RootLocus:
+    """
+    Root locus of the loop k*G with G = num/den, computed without plotting. The closed
+    loop poles of a batch of gains are the eigenvalues of the companion matrices of
+    den + k*num (one vectorized call), the gain grid is refined where the poles move
+    fast (breakaway points) and the stability limits (imaginary axis, or unit circle if
+    discrete) are located by bisection. The results are kept in AnalysisCache.shared.
+
+        rl = RootLocus.from_tf(G, delay=theta)
+        locus = rl.locus()   # gains (G,), poles (G, n) ordered by branch, crossings, ...
+    """
+
+    def __init__(self, num, den, dt=None):
+        """
+        Constructor of the class
+        args:
+            num, den: coefficients of the open loop G (highest power first)
+            dt: sampling time if G is discrete (stability limit on the unit circle)
+        """
+        self.num = np.trim_zeros(np.atleast_1d(np.asarray(num, dtype=float)), 'f')
+        self.den = np.trim_zeros(np.atleast_1d(np.asarray(den, dtype=float)), 'f')
+        if len(self.num) > len(self.den):
+            raise ValueError("The root locus needs a proper open loop (deg num <= deg den).")
+        self.dt = dt
+        self.order = len(self.den) - 1
+
+    @classmethod
+    def from_tf(cls, sys, delay=0.0, pade_order=5):
+        """
+        Root locus of a SISO python-control transfer function. A continuous dead time is
+        included with a Pade approximation of order pade_order.
+        """
+        num = np.asarray(sys.num[0][0], dtype=float)
+        den = np.asarray(sys.den[0][0], dtype=float)
+        dt = sys.dt if sys.dt not in (None, 0) else None
+        if delay > 0 and dt is None:
+            from control import pade
+            pade_num, pade_den = pade(delay, pade_order)
+            num, den = np.polymul(num, pade_num), np.polymul(den, pade_den)
+        return cls(num, den, dt=None if dt is None else float(dt))
+
+    def poles(self, gains):
+        """
+        Closed loop poles (roots of den + k*num) of every gain
+        args:
+            gains: array of G gains
+        returns:
+            poles: complex array (G, n), unordered
+        """
+        gains = np.atleast_1d(np.asarray(gains, dtype=float))
+        num = np.concatenate((np.zeros(len(self.den) - len(self.num)), self.num))
+        p = self.den[None, :] + gains[:, None] * num[None, :]  # Characteristic polynomials
+        n = self.order
+        if n == 0:
+            return np.zeros((len(gains), 0), dtype=complex)
+        companion = np.zeros((len(gains), n, n))
+        companion[:, 0, :] = -p[:, 1:] / p[:, :1]
+        companion[:, np.arange(1, n), np.arange(n - 1)] = 1.0
+        return np.linalg.eigvals(companion)
+
+    def _margin(self, poles):
+        # Stability margin of each gain: max real part (continuous) or max |z| - 1 (discrete)
+        if self.dt is None:
+            return poles.real.max(axis=1)
+        return np.abs(poles).max(axis=1) - 1.0
+
+    @staticmethod
+    def _order_branches(poles):
+        # Reorder the poles of each gain to follow the branches of the previous gain
+        from scipy.optimize import linear_sum_assignment
+
+        ordered = poles.copy()
+        for i in range(1, len(poles)):
+            cost = np.abs(ordered[i - 1][:, None] - poles[i][None, :])
+            _, columns = linear_sum_assignment(cost)
+            ordered[i] = poles[i][columns]
+        return ordered
+
+    def locus(self, gains=None, n_gains=100, tol=0.02, max_points=4000):
+        """
+        Root locus with adaptive refinement of the gain grid
+        args:
+            gains: initial gain grid (0 and a logarithmic grid around the inverse of the
+                   static gain if None)
+            n_gains: points of the default initial grid
+            tol: maximum pole displacement between consecutive gains, as a fraction of
+                 the spread of the open loop poles and zeros (or of the pole modulus,
+                 for the poles far away on the asymptotes)
+            max_points: maximum number of gains after the refinement
+        returns:
+            dictionary with
+                gains: refined gain grid (G,)
+                poles: closed loop poles (G, n), each column is a branch
+                open_loop_poles, open_loop_zeros
+                crossings: gains where the closed loop changes its stability
+                crossing_poles: poles (len(crossings), n) at those gains
+                stable: boolean array (G,), closed loop stability of each gain
+        """
+        options = ('root_locus', None if gains is None else np.asarray(gains, dtype=float).tobytes(),
+                   n_gains, tol, max_points)
+        return AnalysisCache.shared.get(AnalysisCache.key(self.num, self.den, self.dt), options,
+                                        lambda: self._locus(gains, n_gains, tol, max_points))
+
+    def _locus(self, gains, n_gains, tol, max_points):
+        # Root locus without cache (see locus)
+        if gains is None:
+            static = np.polyval(self.den, 1.0 if self.dt is not None else 0.0)
+            static_num = np.polyval(self.num, 1.0 if self.dt is not None else 0.0)
+            scale = abs(static / static_num) if static_num != 0 and static != 0 else 1.0
+            gains = np.concatenate(([0.0], scale * np.logspace(-3, 3, n_gains)))
+        gains = np.unique(np.asarray(gains, dtype=float))
+        poles = self.poles(gains)
+
+        # Spread of the open loop singularities, used to scale the displacement tolerance
+        singular = np.concatenate((np.roots(self.den), np.roots(self.num) if len(self.num) > 1 else []))
+        size = max(np.ptp(singular.real) + np.ptp(singular.imag), np.abs(singular).max(initial=0.0), 1e-12)
+        while len(gains) < max_points:
+            # Largest distance from a pole to the closest pole of the next gain
+            distance = np.abs(poles[:-1, :, None] - poles[1:, None, :]).min(axis=2)
+            distance = (distance / np.maximum(size, np.abs(poles[:-1]))).max(axis=1)
+            coarse = np.flatnonzero(distance > tol)
+            if coarse.size == 0:
+                break
+            coarse = coarse[:max_points - len(gains)]
+            new_gains = 0.5 * (gains[coarse] + gains[coarse + 1])
+            gains = np.concatenate((gains, new_gains))
+            poles = np.concatenate((poles, self.poles(new_gains)))
+            order = np.argsort(gains, kind='stable')
+            gains, poles = gains[order], poles[order]
+
+        # Stability limits: bisection of the intervals where the margin changes sign
+        margin = self._margin(poles)
+        change = np.flatnonzero(np.sign(margin[:-1]) * np.sign(margin[1:]) < 0)
+        lo, hi = gains[change], gains[change + 1]
+        for _ in range(60):
+            if lo.size == 0:
+                break
+            mid = 0.5 * (lo + hi)
+            m_mid = self._margin(self.poles(mid))
+            m_lo = self._margin(self.poles(lo))
+            same = np.sign(m_mid) == np.sign(m_lo)
+            lo, hi = np.where(same, mid, lo), np.where(same, hi, mid)
+        crossings = 0.5 * (lo + hi)
+
+        return {
+            'gains': gains,
+            'poles': self._order_branches(poles),
+            'open_loop_poles': np.roots(self.den),
+            'open_loop_zeros': np.roots(self.num) if len(self.num) > 1 else np.zeros(0, dtype=complex),
+            'crossings': crossings,
+            'crossing_poles': self.poles(crossings),
+            'stable': margin < 0
+        }
+
+
+class AnalysisCache:
+    """
+    LRU cache of the analyses of a system (poles and zeros, frequency response, step
+    response, margins, root locus, sampling time) shared by the GUI, the command line
+    and the tuning sweeps. The systems are keyed by a hash of (num, den, dt, delay), with
+    the coefficients normalized by the leading coefficient of den, so the same model
+    built again (another click on an analysis, another sweep) is a cache hit. When more
+    than maxsize systems are stored the least recently used one is dropped. The cached
+    arrays are read only.
+
+        cache = AnalysisCache.shared
+        margins = cache.margins([0.6], [160, 1], delay=12.5)   # second call: hit
+        num, den, dt = AnalysisCache.split_tf(Gz)
+        pz = cache.poles_zeros(num, den, dt)
+    """
+
+    shared = None  # Instance used by the modules, created below the class
+
+    def __init__(self, maxsize=128):
+        """
+        Constructor of the class
+        args:
+            maxsize: number of systems kept (each with all its analyses)
+        """
+        self.maxsize = maxsize
+        self.entries = OrderedDict()  # key -> {analysis: result}, least recently used first
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def split_tf(sys):
+        """
+        Coefficients of a SISO python-control transfer function
+        returns:
+            num, den, dt (None if continuous)
+        """
+        dt = sys.dt
+        if dt is True:  # Discrete with unspecified sampling time
+            dt = 1.0
+        elif not dt:
+            dt = None
+        return np.asarray(sys.num[0][0], dtype=float), np.asarray(sys.den[0][0], dtype=float), dt
+
+    @staticmethod
+    def normalize(num, den):
+        """ Coefficients without leading zeros, divided by the leading coefficient of den """
+        num = np.trim_zeros(np.atleast_1d(np.asarray(num, dtype=float)), 'f')
+        den = np.trim_zeros(np.atleast_1d(np.asarray(den, dtype=float)), 'f')
+        if den.size == 0:
+            raise ValueError("The denominator of the system is zero.")
+        if num.size == 0:
+            num = np.zeros(1)
+        return num / den[0] + 0.0, den / den[0] + 0.0  # + 0.0 turns -0.0 into 0.0
+
+    @staticmethod
+    def key(num, den, dt=None, delay=0.0):
+        """ Hash (hex string) of the system (num, den, dt, delay) """
+        num, den = AnalysisCache.normalize(num, den)
+        digest = hashlib.sha1()
+        digest.update(num.tobytes())
+        digest.update(b'/')
+        digest.update(den.tobytes())
+        digest.update(repr((None if dt is None else float(dt), float(delay))).encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _read_only(result):
+        # Protect the cached arrays (also inside dictionaries and tuples)
+        if isinstance(result, np.ndarray):
+            result.setflags(write=False)
+        elif isinstance(result, dict):
+            for value in result.values():
+                AnalysisCache._read_only(value)
+        elif isinstance(result, (tuple, list)):
+            for value in result:
+                AnalysisCache._read_only(value)
+        return result
+
+    def get(self, key, analysis, compute):
+        """
+        Cached result of an analysis of a system, computed with compute() if missing
+        args:
+            key: key of the system (AnalysisCache.key)
+            analysis: hashable name of the analysis and its options
+            compute: function without arguments that returns the result
+        """
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and analysis in entry:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[analysis]
+            self.misses += 1
+        result = self._read_only(compute())  # Outside the lock, other systems are not blocked
+        with self._lock:
+            self.entries.setdefault(key, {})[analysis] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return result
+
+    def clear(self):
+        """ Drop every entry and reset the statistics """
+        with self._lock:
+            self.entries.clear()
+            self.hits = self.misses = 0
+
+    def info(self):
+        """ Statistics of the cache: hits, misses, systems and maxsize """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'systems': len(self.entries), 'maxsize': self.maxsize}
+
+    def poles_zeros(self, num, den, dt=None, delay=0.0):
+        """
+        Poles, zeros and static gain (at s = 0, or z = 1 if discrete) of the system.
+        The dead time adds neither poles nor zeros.
+        returns:
+            dictionary with poles, zeros and gain
+        """
+        def compute():
+            n, d = self.normalize(num, den)
+            point = 1.0 if dt is not None else 0.0
+            with np.errstate(divide='ignore', invalid='ignore'):
+                gain = np.polyval(n, point) / np.polyval(d, point)
+            return {'poles': np.roots(d), 'zeros': np.roots(n), 'gain': float(gain)}
+
+        return self.get(self.key(num, den, dt, delay), 'poles_zeros', compute)
+
+    def frequency_response(self, num, den, dt=None, delay=0.0, w=None):
+        """
+        Bode data of the system with the exact dead time (FrequencyResponse.bode)
+        args:
+            w: frequencies in rad/s (FrequencyResponse.default_grid if None)
+        returns:
+            dictionary with w, mag_db and phase_deg (1D arrays)
+        """
+        def compute():
+            fr = FrequencyResponse(*self.normalize(num, den), delay=delay, dt=dt)
+            mag_db, phase_deg, grid = fr.bode(fr.default_grid() if w is None else w)
+            return {'w': np.array(grid, dtype=float), 'mag_db': mag_db[0], 'phase_deg': phase_deg[0]}
+
+        grid = None if w is None else hashlib.sha1(np.asarray(w, dtype=float).tobytes()).hexdigest()
+        return self.get(self.key(num, den, dt, delay), ('frequency_response', grid), compute)
+
+    def margins(self, num, den, dt=None, delay=0.0):
+        """
+        Stability margins of the loop with unit feedback (FrequencyResponse.margins)
+        returns:
+            dictionary with gm, gm_db, pm, wcg, wcp and dm (floats)
+        """
+        def compute():
+            fr = FrequencyResponse(*self.normalize(num, den), delay=delay, dt=dt)
+            return {name: float(value[0]) for name, value in fr.margins().items()}
+
+        return self.get(self.key(num, den, dt, delay), 'margins', compute)
+
+    def step_response(self, num, den, dt=None, delay=0.0, duration=None, n_samples=1000):
+        """
+        Unit step response of the system. The dead time shifts the response (by whole
+        samples if discrete).
+        args:
+            duration: simulated time (6 times the slowest time constant plus the delay if None)
+            n_samples: points of a continuous response (discrete: one per sampling time)
+        returns:
+            dictionary with t and y (1D arrays)
+        """
+        def compute():
+            from scipy.signal import step, dstep
+
+            n, d = self.normalize(num, den)
+            poles = np.roots(d)
+            if dt is not None:
+                poles = np.log(np.abs(poles[poles != 0])) / dt  # Continuous equivalent rates
+            rates = np.abs(poles.real[poles.real < 0])
+            t_end = duration
+            if t_end is None:
+                t_end = delay + (6.0 / rates.min() if rates.size else 100.0)
+            if dt is not None:
+                d_samples = int(round(delay / dt))
+                t_out, (y,) = dstep((n, d, dt), n=int(t_end / dt) + 1)
+                y = np.concatenate((np.zeros(d_samples), y[:, 0]))[:len(t_out)]
+                return {'t': np.asarray(t_out, dtype=float), 'y': y}
+            t = np.linspace(0.0, t_end, n_samples)
+            t_out, y = step((n, d), T=t)
+            y = np.interp(t - delay, t, y, left=0.0) if delay > 0 else y
+            return {'t': t, 'y': np.asarray(y, dtype=float)}
+
+        return self.get(self.key(num, den, dt, delay), ('step_response', duration, n_samples), compute)
+
+    def root_locus(self, num, den, dt=None, delay=0.0, pade_order=5, **options):
+        """
+        Root locus of the loop (RootLocus.locus with the options given). A continuous
+        dead time is approximated with a Pade approximation of order pade_order, a
+        discrete one adds round(delay/dt) poles at z = 0.
+        """
+        def compute():
+            n, d = self.normalize(num, den)
+            if delay > 0 and dt is None:
+                from control import pade
+                pade_num, pade_den = pade(delay, pade_order)
+                n, d = np.polymul(n, pade_num), np.polymul(d, pade_den)
+            elif delay > 0:
+                d = np.concatenate((d, np.zeros(int(round(delay / dt)))))
+            return RootLocus(n, d, dt=dt)._locus(options.get('gains'), options.get('n_gains', 100),
+                                                 options.get('tol', 0.02), options.get('max_points', 4000))
+
+        gains = options.get('gains')
+        analysis = ('root_locus', pade_order, None if gains is None else np.asarray(gains, dtype=float).tobytes(),
+                    tuple(sorted((k, v) for k, v in options.items() if k != 'gains')))
+        return self.get(self.key(num, den, dt, delay), analysis, compute)
+
+
+AnalysisCache.shared = AnalysisCache()
+
+
+class StepMetrics:
+    """
+    Performance metrics of step responses computed from the arrays, without plotting.
+    Every metric is evaluated for a batch of responses at once (one row per candidate,
+    shape (N, n)), so thousands of candidate controllers or gains can be ranked per
+    second.
+
+        metrics = StepMetrics.compute(t, y, r=setpoint, y0=25.0, u=u)
+        best = np.argmin(metrics['iae'])
+        t, y, u = StepMetrics.gain_responses(num, den, gains, dt=Ts)   # P control, N gains
+    """
+
+    NAMES = ('rise_time', 'peak_time', 'overshoot', 'settling_time', 'steady_state_error',
+             'iae', 'ise', 'itae', 'effort')
+
+    @staticmethod
+    def _crossing(t, z, level):
+        # First time each row of z reaches level (linear interpolation), nan if never
+        above = z >= level
+        i = np.argmax(above, axis=1)
+        i0 = np.maximum(i - 1, 0)
+        rows = np.arange(len(z))
+        z0, z1 = z[rows, i0], z[rows, i]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraction = np.clip(np.where(z1 != z0, (level - z0) / (z1 - z0), 0.0), 0.0, 1.0)
+        crossing = np.where(i > 0, t[i0] + fraction * (t[i] - t[i0]), t[i])
+        return np.where(above.any(axis=1), crossing, np.nan)
+
+    @staticmethod
+    def gain_responses(num, den, gains, dt=None, n_samples=500, duration=None, r=1.0):
+        """
+        Closed loop step responses of the loop with a proportional controller, u = K*(r - y),
+        for a batch of gains. A continuous G is discretized with zero order hold at
+        duration/n_samples. The difference equation runs once for all the gains.
+        args:
+            num, den: coefficients of G (highest power first)
+            gains: array of N gains K
+            dt: sampling time of a discrete G (None: continuous)
+            n_samples: samples of each response
+            duration: simulated time of a continuous G (6 times its slowest time constant if None)
+            r: setpoint step
+        returns:
+            t (n,), y (N, n), u (N, n)
+        """
+        num, den = AnalysisCache.normalize(num, den)
+        if dt is None:
+            from scipy.signal import cont2discrete
+
+            if duration is None:
+                poles = np.roots(den)
+                rates = np.abs(poles.real[poles.real < 0])
+                duration = 6.0 / rates.min() if rates.size else 100.0
+            dt = duration / n_samples
+            num, den, _ = cont2discrete((num, den), dt, method='zoh')
+            num, den = AnalysisCache.normalize(np.ravel(num), den)
+        n = len(den) - 1
+        b = np.concatenate((np.zeros(n + 1 - len(num)), num))  # Same length as den, b[0] for z^n
+        gains = np.atleast_1d(np.asarray(gains, dtype=float))[:, None]
+
+        # y[k] = -a1*y[k-1] - ... - an*y[k-n] + b0*u[k] + ... + bn*u[k-n] with u[k] = K*(r - y[k])
+        y = np.zeros((len(gains), n + n_samples))  # n zeros before the step
+        u = np.zeros((len(gains), n + n_samples))
+        a_past, b_past = den[:0:-1], b[:0:-1]  # Coefficients of the samples k-n ... k-1
+        loop = 1.0 + b[0] * gains[:, 0]
+        for k in range(n, n + n_samples):
+            past = u[:, k - n:k] @ b_past - y[:, k - n:k] @ a_past
+            y[:, k] = (past + b[0] * gains[:, 0] * r) / loop
+            u[:, k] = gains[:, 0] * (r - y[:, k])
+        return np.arange(n_samples) * dt, y[:, n:], u[:, n:]
+
+    @staticmethod
+    def compute(t, y, r=1.0, y0=None, u=None, band=0.02, rise=(0.1, 0.9), relative_to='setpoint'):
+        """
+        Metrics of step responses
+        args:
+            t: time vector with n samples
+            y: responses, array (N, n) with one response per row (or (n,) for one)
+            r: setpoint after the step, scalar or N values (1 for a unit step)
+            y0: output before the step, scalar or N values (first sample if None)
+            u: control actions (N, n) for the effort (nan if None)
+            band: settling band as a fraction of the step
+            rise: fractions of the step that define the rise time (10 % to 90 %)
+            relative_to: 'setpoint' to measure rise, overshoot and settling against the
+                         step to r (tracking), or 'final' against the last value of each
+                         response (systems with steady state error, as step_info)
+        returns:
+            dictionary with the metrics of NAMES, arrays of N values (scalars if y is 1D):
+                rise_time, peak_time [s] (nan if the response never rises)
+                overshoot [%] of the step
+                settling_time [s] (inf if the response does not settle)
+                steady_state_error: r - last value
+                iae, ise, itae: integrals of the error r - y
+                effort: sum of |du|
+        """
+        if relative_to not in ('setpoint', 'final'):
+            raise ValueError(f"Invalid relative_to '{relative_to}'. Use 'setpoint' or 'final'.")
+        t = np.asarray(t, dtype=float)
+        single = np.ndim(y) == 1
+        y = np.atleast_2d(np.asarray(y, dtype=float))
+        column = lambda value: np.reshape(np.asarray(value, dtype=float), (-1, 1)) if np.ndim(value) else float(value)
+        r = column(r)
+        y0 = y[:, :1] if y0 is None else column(y0)
+        target = y[:, -1:] if relative_to == 'final' else r
+
+        dt = np.diff(t, prepend=t[0])
+        e = r - y
+        step = np.broadcast_to(target - y0, (len(y), 1))
+        size = np.abs(step[:, 0])
+        rise_from = (y - y0) * np.sign(step)  # Output change in the direction of the step
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z = (y - y0) / step  # Fraction of the step reached
+            outside = np.abs(target - y) > band * np.abs(step)
+            overshoot = np.maximum(0.0, (np.max(rise_from, axis=1) - size) / size * 100)
+        n = t.size
+        last = np.where(outside.any(axis=1), n - 1 - np.argmax(outside[:, ::-1], axis=1), -1)
+        metrics = {
+            'rise_time': StepMetrics._crossing(t, z, rise[1]) - StepMetrics._crossing(t, z, rise[0]),
+            'peak_time': t[np.argmax(rise_from, axis=1)],
+            'overshoot': overshoot,
+            'settling_time': np.where(last >= n - 1, np.inf, t[np.minimum(last + 1, n - 1)]),
+            'steady_state_error': np.broadcast_to(r - y[:, -1:], (len(y), 1))[:, 0].copy(),
+            'iae': np.sum(np.abs(e) * dt, axis=1),
+            'ise': np.sum(e**2 * dt, axis=1),
+            'itae': np.sum(t * np.abs(e) * dt, axis=1),
+            'effort': np.full(len(y), np.nan) if u is None else np.sum(np.abs(np.diff(np.atleast_2d(u), axis=1)), axis=1)
+        }
+        if single:
+            return {name: value[0] for name, value in metrics.items()}
+        return metrics
+
+
+# Maximal-length feedback taps (1-based register positions) for each register length
+PRBS_TAPS = {
+    2: (2, 1), 3: (3, 2), 4: (4, 3), 5: (5, 3), 6: (6, 5), 7: (7, 6),
+    8: (8, 6, 5, 4), 9: (9, 5), 10: (10, 7), 11: (11, 9), 12: (12, 6, 4, 1),
+    13: (13, 4, 3, 1), 14: (14, 5, 3, 1), 15: (15, 14), 16: (16, 15, 13, 4),
+    17: (17, 14), 18: (18, 11), 19: (19, 6, 2, 1), 20: (20, 17), 21: (21, 19),
+    22: (22, 21), 23: (23, 18), 24: (24, 23, 22, 17), 25: (25, 22),
+    26: (26, 6, 2, 1), 27: (27, 5, 2, 1), 28: (28, 25), 29: (29, 27),
+    30: (30, 6, 4, 1), 31: (31, 28), 32: (32, 22, 2, 1)
+}
+
 
 class SignalGenerator:
+    @staticmethod
+    def prbs_bits(register_length, num_bits):
+        """
+        Generates the bit sequence (0/1) of a maximal-length linear feedback shift register.
+
+        Only one register period (2**register_length - 1 bits) is computed, the rest of
+        the sequence is obtained by repeating it. The recursion is evaluated in blocks as
+        long as the smallest feedback delay, so each block is a handful of vector XORs.
+        Over GF(2) the feedback polynomial squared, p(x)**2 = p(x**2), gives the same
+        recursion with all the delays doubled, so once 2**j*register_length bits exist
+        the delays are scaled by 2**j: the blocks double in length as the sequence
+        grows and the cost hardly depends on the tap set (10**7 bits in ~10 ms for
+        every register length).
+
+        Parameters:
+            register_length (int): Length of the shift register (2 to 32).
+            num_bits (int): Number of bits to return.
+
+        Returns:
+            bits (ndarray): uint8 array with num_bits values 0 or 1.
+        """
+        if register_length not in PRBS_TAPS:
+            raise ValueError(f"register_length must be between {min(PRBS_TAPS)} and {max(PRBS_TAPS)}.")
+        n = register_length
+        taps = PRBS_TAPS[n]
+        # Feedback delays of the polynomial and of its reciprocal (both maximal-length),
+        # keep the one with the larger smallest delay to get longer vector blocks
+        delays = sorted(taps)
+        reciprocal = sorted([n] + [n - tap for tap in taps if tap != n])
+        if reciprocal[0] > delays[0]:
+            delays = reciprocal
+        block = delays[0]
+
+        period = 2**n - 1
+        length = min(int(num_bits), period)
+        bits = np.empty(length + n, dtype=np.uint8)
+        bits[:n] = 1  # Seed of the register (any non-zero state)
+        start = n
+        while start < length + n:
+            scale = 1 << ((start // n).bit_length() - 1)  # Largest 2**j with 2**j*n <= start
+            stop = min(start + scale * block, length + n)
+            acc = bits[start - scale * delays[0]:stop - scale * delays[0]].copy()
+            for d in delays[1:]:
+                acc ^= bits[start - scale * d:stop - scale * d]
+            bits[start:stop] = acc
+            start = stop
+        bits = bits[n:]
+
+        if num_bits > period:
+            bits = np.resize(bits, int(num_bits))
+        return bits
+
     @staticmethod
     def create_prbs(initial_value, amplitude, offset, register_length, frequency_divider, num_samples, start_time):
         """
@@ -104,10 +1134,10 @@ class SignalGenerator:
 
         Parameters:
             initial_value (float): Constant initial value before the PRBS sequence starts.
-            amplitude (float): Amplitude of the signal changes (difference between high and low values).
+            amplitude (float): Amplitude of the signal changes around the offset (levels are offset +/- amplitude).
             offset (float): DC level or base value on which the amplitude is applied.
-            register_length (int): Length of the shift register used to generate the sequence. Affects the sequence period.
-            frequency_divider (int): Frequency divider. Controls the duration of each bit in the sequence.
+            register_length (int): Length of the shift register used to generate the sequence (2 to 32). Affects the sequence period.
+            frequency_divider (int): Frequency divider. Number of samples that each bit of the sequence is held.
             num_samples (int): Total number of samples in the generated sequence from start time.
             start_time (int): Time of application or delay before the PRBS sequence starts.
                 
@@ -128,50 +1158,73 @@ class SignalGenerator:
                                 
             
             "Exit parameter" is  :
-            prbs : prbs sequence created by PRBS algo
-
-        """
-        k1 = register_length - 1
-        k2 = register_length
-        if register_length == 5:
-            k1 = 3
-        elif register_length == 7: 
-            k1 = 4
-        elif register_length == 9:   
-            k1 = 5
-        elif register_length == 10: 
-            k1 = 7
-        elif register_length == 11: 
-            k1 = 9    
-        
-        sbpa = [1]*11
-        prbs = [0] * (num_samples + start_time)*2
-        
-        for i in range(start_time):
-           prbs[i] = initial_value;
-        
-        i = start_time + 1
-        while i <= num_samples:
-            uiu = -sbpa[k1]*sbpa[k2]
-            if register_length == 7:
-                uiu = -sbpa[1]*sbpa[2]*sbpa[4]*sbpa[7]
-            
-            j = 0
-            while j <= frequency_divider:
-                prbs[i] = uiu * amplitude + offset
-                i += 1
-                j += 1
-            
-            for j in range(register_length, 0 , -1):
-                sbpa[j] = sbpa[j - 1]
-            
-            sbpa[0] = uiu;
-        
-        # Copy the prbs sequence to a new array from 0 to num_samples avoiding the zeros at the end side effects
-        prbs = prbs[:num_samples]
+            prbs : prbs sequence created by PRBS algo (float64 ndarray of length num_samples)
+
+        """
+        num_samples = int(num_samples)
+        start_time = int(start_time)
+        frequency_divider = max(int(frequency_divider), 1)
+
+        prbs = np.full(num_samples, initial_value, dtype=np.float64)
+
+        # Generate one bit per register period and hold each bit frequency_divider samples
+        n_prbs = num_samples - start_time
+        if n_prbs > 0:
+            n_bits = -(-n_prbs // frequency_divider)
+            bits = SignalGenerator.prbs_bits(register_length, n_bits)
+            levels = offset + amplitude * (2.0 * bits - 1.0)
+            prbs[start_time:] = np.repeat(levels, frequency_divider)[:n_prbs]
 
         #Convert the last 4 values to initial value
-        for i in range(1,5):
-            prbs[-i] = initial_value
+        prbs[-4:] = initial_value
+
+        return prbs
+
+
+if __name__ == "__main__":
+    # Fast correctness checks, the benchmarks are in tclab/tools_benchmark.py
+    import tempfile
+
+    # Every tap set produces a maximal-length sequence
+    for n in range(2, 17):
+        period = 2**n - 1
+        bits = SignalGenerator.prbs_bits(n, 2 * period)
+        assert np.array_equal(bits[:period], bits[period:]), n
+        assert bits[:period].sum() == 2**(n - 1), n
+
+    # Bundles: round trip, and a text file ending in a blank line
+    with tempfile.TemporaryDirectory() as folder:
+        t = np.arange(5.0)
+        DataSaver.save_bundle(os.path.join(folder, 'bundle'), (t, 2 * t, 3 * t))
+        txt_file = os.path.join(folder, 'data.txt')
+        DataSaver.save_txt(t, 2 * t, 3 * t, txt_file)
+        with open(txt_file, 'a') as f:
+            f.write('\n')
+        DataSaver.convert_txt(txt_file, os.path.join(folder, 'converted'))
+        for name in ('bundle', 'converted'):
+            columns, header = DataSaver.load_bundle(os.path.join(folder, name))
+            assert header['rows'] == 5 and all(np.array_equal(c, k * t) for c, k in zip(columns, (1, 2, 3))), name
+            del columns
+
+    # Margins of L = 2*exp(-0.5*s)/(s + 1): wcp = sqrt(3), pm = 120 - 0.5*sqrt(3) rad
+    margins = FrequencyResponse.fopdt(2.0, 1.0, 0.5).margins()
+    assert np.isclose(margins['wcp'][0], np.sqrt(3.0))
+    assert np.isclose(margins['pm'][0], 120.0 - np.degrees(0.5 * np.sqrt(3.0)))
+
+    # Root locus of 1/((s + 1)(s + 2)(s + 3)): unstable beyond K = 60
+    locus = RootLocus([1.0], np.poly([-1.0, -2.0, -3.0])).locus()
+    assert np.isclose(locus['crossings'][0], 60.0, rtol=1e-6)
+
+    # The cache key does not depend on the scaling of the coefficients
+    assert AnalysisCache.key([0.6], [160.0, 1.0]) == AnalysisCache.key([0.0, 1.2], [320.0, 2.0])
+
+    # Closed loop bandwidth of K/(tau*s + 1) is (1 + K)/tau
+    wb = SamplingTime.bandwidth(FrequencyResponse([5.0], [160.0, 1.0]), closed_loop=True)
+    assert np.isclose(wb[0], 6.0 / 160.0)
 
-        return prbs
\ No newline at end of file
+    # First order step: 10-90 % rise time tau*ln(9), 2 % settling time tau*ln(50)
+    t = np.linspace(0.0, 10.0, 100001)
+    metrics = StepMetrics.compute(t, 1.0 - np.exp(-t))
+    assert np.isclose(metrics['rise_time'], np.log(9.0), atol=1e-3)
+    assert np.isclose(metrics['settling_time'], np.log(50.0), atol=1e-3)
+    print("tools checks passed.")
@@ -0,0 +1,227 @@
+"""
+Benchmarks of the numerical engines of tools.py (the same module in tclab and
+motor_dc). Each benchmark compares an engine with the implementation it replaced or
+with python-control; the fast correctness checks stay in `python tools.py`.
+
+    python tools_benchmark.py                    # every benchmark
+    python tools_benchmark.py prbs formats --rows 1000000   # formats default is 10**7 rows
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from tools import (DataSaver, SignalGenerator, FrequencyResponse, RootLocus, AnalysisCache, SamplingTime,
+                   StepMetrics)
+
+
+def create_prbs_loop(initial_value, amplitude, offset, register_length, frequency_divider, num_samples, start_time):
+    # Previous pure-Python implementation, kept here only as benchmark reference
+    k1, k2 = 7, register_length
+    sbpa = [1]*11
+    prbs = [0] * (num_samples + start_time)*2
+    for i in range(start_time):
+        prbs[i] = initial_value
+    i = start_time + 1
+    while i <= num_samples:
+        uiu = -sbpa[k1]*sbpa[k2]
+        j = 0
+        while j <= frequency_divider:
+            prbs[i] = uiu * amplitude + offset
+            i += 1
+            j += 1
+        for j in range(register_length, 0, -1):
+            sbpa[j] = sbpa[j - 1]
+        sbpa[0] = uiu
+    prbs = prbs[:num_samples]
+    for i in range(1, 5):
+        prbs[-i] = initial_value
+    return prbs
+
+
+def bench_prbs(args):
+    """ PRBS generators: pure-Python loop against numpy, and the register lengths """
+    for num_samples in (10**5, 10**6):
+        params = (0, 5, 50, 10, 50, num_samples, 30)
+        t0 = time.perf_counter()
+        create_prbs_loop(*params)
+        t_loop = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        SignalGenerator.create_prbs(*params)
+        t_vec = time.perf_counter() - t0
+        print(f"{num_samples:>10d} samples: loop {t_loop:8.3f} s  numpy {t_vec:8.4f} s  speedup {t_loop / t_vec:7.1f}x")
+    for register_length in (10, 16, 24, 32):
+        t0 = time.perf_counter()
+        SignalGenerator.prbs_bits(register_length, 10**7)
+        print(f"register {register_length:2d}: 10**7 bits in {1000 * (time.perf_counter() - t0):6.1f} ms")
+
+
+def bench_formats(args):
+    """ Text files against binary bundles """
+    rows = args.rows
+    folder = tempfile.mkdtemp()
+    try:
+        txt_file = os.path.join(folder, 'data.txt')
+        bundle = os.path.join(folder, 'data_bundle')
+        t = np.arange(rows, dtype=float)
+        u = SignalGenerator.create_prbs(0, 5, 50, 10, 50, rows, 30)
+        y = 25 + np.cumsum(u - 50) * 1e-3
+        timings = []
+        t0 = time.perf_counter()
+        DataSaver.save_txt(t, u, y, txt_file)
+        timings.append(('save_txt', time.perf_counter() - t0))
+        t0 = time.perf_counter()
+        DataSaver.save_bundle(bundle, (t, u, y), Ts=1.0)
+        timings.append(('save_bundle', time.perf_counter() - t0))
+        t0 = time.perf_counter()
+        data_txt = DataSaver.load(txt_file)
+        timings.append(('np.loadtxt', time.perf_counter() - t0))
+        t0 = time.perf_counter()
+        columns, header = DataSaver.load_bundle(bundle)
+        timings.append(('load_bundle (mmap)', time.perf_counter() - t0))
+        t0 = time.perf_counter()
+        np.sum(columns[2])
+        timings.append(('sum of mapped column', time.perf_counter() - t0))
+        t0 = time.perf_counter()
+        DataSaver.convert_txt(txt_file, bundle + '_converted')
+        timings.append(('convert_txt', time.perf_counter() - t0))
+        print(f"Experiment formats with {rows} rows:")
+        for name, elapsed in timings:
+            print(f"  {name:22s} {elapsed:9.3f} s")
+        converted, _ = DataSaver.load_bundle(bundle + '_converted')
+        assert np.allclose(converted[2], data_txt[:, 2]) and np.array_equal(columns[0], t)
+        print(f"  text file {os.path.getsize(txt_file) / 1e6:.0f} MB, bundle {3 * 8 * rows / 1e6:.0f} MB")
+        del columns, converted
+    finally:
+        shutil.rmtree(folder)
+
+
+def bench_margins(args):
+    """ Margins of PID loops with the exact dead time against python-control with Pade """
+    from control import pade
+    from control.matlab import tf, margin
+
+    rng = np.random.default_rng(0)
+    N = 2000
+    Kp, Ti, Td = rng.uniform(5, 30, N), rng.uniform(20, 100, N), rng.uniform(0, 8, N)
+    loops = FrequencyResponse.fopdt(0.6, 160.0, 12.0, Kp=Kp, Ti=Ti, Td=Td)
+    t0 = time.perf_counter()
+    margins = loops.margins()
+    elapsed = time.perf_counter() - t0
+    G = tf([0.6], [160.0, 1.0]) * tf(*pade(12.0, 12))
+    t0 = time.perf_counter()
+    reference = [margin(tf([Kp[i] * Ti[i] * Td[i], Kp[i] * Ti[i], Kp[i]], [Ti[i], 0]) * G) for i in range(20)]
+    t_control = (time.perf_counter() - t0) / 20
+    error = max(abs(ref[1] - margins['pm'][i]) for i, ref in enumerate(reference))
+    print(f"Margins of {N} loops in {elapsed:.3f} s ({N / elapsed:.0f} loops/s, python-control {1 / t_control:.0f} loops/s), "
+          f"max phase margin difference {error:.1e} deg")
+
+
+def bench_root_locus(args):
+    """ Root locus of the FOPDT model with a Pade approximation of the dead time """
+    from control import pade, root_locus_map
+    from control.matlab import tf
+
+    G = tf([0.6], [160.0, 1.0]) * tf(*pade(12.0, 8))
+    AnalysisCache.shared.clear()
+    t0 = time.perf_counter()
+    locus = RootLocus.from_tf(G).locus()
+    elapsed = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    root_locus_map(G)
+    t_control = time.perf_counter() - t0
+    print(f"Root locus with {len(locus['gains'])} gains in {1000 * elapsed:.1f} ms (python-control {1000 * t_control:.1f} ms), "
+          f"stability limit K = {locus['crossings'][0]:.3f}, gain margin {FrequencyResponse.from_tf(G).margins()['gm'][0]:.3f}")
+
+
+def bench_analysis_cache(args):
+    """ Repeated analyses of the same model served by the shared cache """
+    from control.matlab import tf
+
+    cache = AnalysisCache.shared
+    cache.clear()
+    for attempt in ('first', 'repeated'):
+        t0 = time.perf_counter()
+        Gz = tf([0.0, 0.0037], [1.0, -0.9938], 1.0)  # A new object every time, same coefficients
+        num, den, dt = AnalysisCache.split_tf(Gz)
+        pz = cache.poles_zeros(num, den, dt, delay=12.0)
+        cache.frequency_response(num, den, dt, delay=12.0)
+        step_data = cache.step_response(num, den, dt, delay=12.0)
+        stability = cache.margins(num, den, dt, delay=12.0)
+        cache.root_locus(num, den, dt, delay=12.0)
+        print(f"Analyses of Gz, {attempt}: {1000 * (time.perf_counter() - t0):.2f} ms, "
+              f"gm {stability['gm']:.3f}, final step value {step_data['y'][-1]:.3f} (gain {pz['gain']:.3f})")
+    print(f"Analysis cache: {cache.info()}")
+
+
+def bench_sampling_time(args):
+    """ Sampling time of many closed loops with dead time against the Bode grid of python-control """
+    from control import pade
+    from control.matlab import tf, bode, feedback
+
+    rng = np.random.default_rng(0)
+    N = 5000
+    K, tau, theta = rng.uniform(0.3, 1.0, N), rng.uniform(50, 300, N), rng.uniform(1, 30, N)
+    t0 = time.perf_counter()
+    ts = SamplingTime.fopdt(K, tau, theta, closed_loop=True)
+    elapsed = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for i in range(20):
+        mag, phase, w = bode(feedback(tf([K[i]], [tau[i], 1]) * tf(*pade(theta[i], 8)), 1), plot=False)
+        reference = w[np.where(mag >= SamplingTime.LEVEL * mag[0])[0][-1]]
+    t_control = (time.perf_counter() - t0) / 20
+    print(f"Closed loop bandwidth of {N} FOPDT models in {1000 * elapsed:.1f} ms ({N / elapsed:.0f} models/s, "
+          f"Bode grid {1 / t_control:.0f} models/s), last model wb {ts['wb'][19]:.5f} (grid {reference:.5f}) rad/s")
+
+
+def bench_step_metrics(args):
+    """ Step metrics of many proportional gains against python-control step_info """
+    from control import step_info
+    from control.matlab import tf, c2d, feedback
+
+    Gz = c2d(tf([0.6], [160.0, 1.0]), 2.0) * tf([1.0], [1.0] + [0.0] * 6, 2.0)  # 12 s of dead time
+    num, den, dt = AnalysisCache.split_tf(Gz)
+    gains = np.linspace(0.5, 30.0, 5000)
+    t0 = time.perf_counter()
+    t, y, u = StepMetrics.gain_responses(num, den, gains, dt=dt, n_samples=500)
+    metrics = StepMetrics.compute(t, y, r=1.0, y0=0.0, u=u, relative_to='final')
+    elapsed = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    checked = np.arange(0, len(gains), 1000)
+    reference = [step_info(feedback(gains[i] * Gz, 1), T=t) for i in checked]
+    t_control = (time.perf_counter() - t0) / len(checked)
+    error = max(abs(ref['Overshoot'] - metrics['overshoot'][i]) for i, ref in zip(checked, reference))
+    print(f"Step metrics of {len(gains)} gains in {1000 * elapsed:.1f} ms ({len(gains) / elapsed:.0f} gains/s, "
+          f"step_info {1 / t_control:.0f} gains/s), max overshoot difference {error:.1e} %")
+
+
+BENCHMARKS = {
+    'prbs': bench_prbs,
+    'formats': bench_formats,
+    'margins': bench_margins,
+    'root_locus': bench_root_locus,
+    'analysis_cache': bench_analysis_cache,
+    'sampling_time': bench_sampling_time,
+    'step_metrics': bench_step_metrics,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('benchmarks', nargs='*', help=f"benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument('--rows', type=int, default=10**7, help='rows of the experiment formats benchmark (default 10**7)')
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    for name in args.benchmarks or BENCHMARKS:
+        print(f"== {name}: {BENCHMARKS[name].__doc__.strip()}")
+        BENCHMARKS[name](args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())